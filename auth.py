@@ -1,13 +1,68 @@
 import sqlite3
 import hashlib
+import threading
+from contextlib import contextmanager
 
 DB_NAME = "users.db"
 
-def create_users_table():
-    """Creates the users table if it doesn't exist."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
+
+class ConnectionManager:
+    """Hands out one reusable SQLite connection per thread.
+
+    Connections are opened in WAL mode so logins (readers) are not blocked by
+    registrations (writers), and the schema is created on first use instead
+    of at import time.
+    """
+
+    def __init__(self, db_name=DB_NAME, busy_timeout_ms=5000):
+        self.db_name = db_name
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout_ms / 1000)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+            # Off by default in SQLite; enrollments rely on ON DELETE CASCADE
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._ensure_schema(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Commits on success and rolls back on error."""
+        conn = self.connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def close(self):
+        """Closes the calling thread's connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _ensure_schema(self, conn):
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                _create_schema(conn)
+                self._schema_ready = True
+
+
+def _create_schema(conn):
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
@@ -15,7 +70,14 @@ def create_users_table():
         )
     """)
     conn.commit()
-    conn.close()
+
+
+db = ConnectionManager()
+
+
+def create_users_table():
+    """Creates the users table if it doesn't exist."""
+    _create_schema(db.connection())
 
 def hash_password(password):
     """Hashes a password using SHA-256."""
@@ -23,28 +85,38 @@ def hash_password(password):
 
 def register_user(username, password):
     """Registers a new user."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hash_password(password)))
-        conn.commit()
-        conn.close()
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hash_password(password)))
         return True
     except sqlite3.IntegrityError:
-        conn.close()
         return False  # Username already exists
 
 def verify_user(username, password):
     """Verifies user login credentials."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT password FROM users WHERE username = ?", (username,))
-    result = cursor.fetchone()
-    conn.close()
-    
+    result = db.connection().execute(
+        "SELECT password FROM users WHERE username = ?", (username,)
+    ).fetchone()
+
     if result and result[0] == hash_password(password):
         return True
     return False
 
-# Initialize database
-create_users_table()
+def import_users(users, hashed=False):
+    """Bulk-inserts (username, password) pairs in a single transaction.
+
+    Existing usernames are skipped. Pass ``hashed=True`` when migrating
+    passwords that are already SHA-256 hex digests.
+
+    Returns:
+        int: Number of users inserted.
+    """
+    if hashed:
+        rows = ((username, password) for username, password in users)
+    else:
+        rows = ((username, hash_password(password)) for username, password in users)
+
+    with db.transaction() as conn:
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)", rows)
+        return conn.total_changes - before
@@ -0,0 +1,94 @@
+"""Benchmark for the auth.py user store.
+
+Measures bulk import, registration and login throughput against a scratch
+database, with reused WAL connections and, for comparison, the previous
+connect-per-call pattern.
+
+    python bench_auth.py --users 20000 --threads 8
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import auth
+
+
+def naive_register(db_name, username, password):
+    conn = sqlite3.connect(db_name, timeout=30)
+    try:
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, auth.hash_password(password)))
+        conn.commit()
+        return True
+    except sqlite3.IntegrityError:
+        return False
+    finally:
+        conn.close()
+
+
+def naive_verify(db_name, username, password):
+    conn = sqlite3.connect(db_name, timeout=30)
+    result = conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+    conn.close()
+    return bool(result and result[0] == auth.hash_password(password))
+
+
+def timed(label, count, threads, fn, items):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda item: fn(*item), items))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {count / elapsed:>10.0f} ops/s  ({elapsed:.2f}s)")
+    return results
+
+
+def run(users, threads):
+    # Scratch databases (and their -wal/-shm files) are removed afterwards
+    with tempfile.TemporaryDirectory(prefix="bench_auth_") as workdir:
+        try:
+            _run(workdir, users, threads)
+        finally:
+            auth.db.close()
+
+
+def _run(workdir, users, threads):
+    credentials = [(f"user{i}", f"password{i}") for i in range(users)]
+    logins = credentials[: users // 2]
+
+    # Bulk import
+    auth.db = auth.ConnectionManager(os.path.join(workdir, "import.db"))
+    start = time.perf_counter()
+    inserted = auth.import_users(credentials)
+    elapsed = time.perf_counter() - start
+    print(f"{'import_users (one transaction)':<32} {inserted / elapsed:>10.0f} ops/s  ({elapsed:.2f}s)")
+
+    # Logins against the imported users, reused connections
+    timed("verify_user (WAL, reused)", len(logins), threads, auth.verify_user, logins)
+
+    # Registration, reused connections
+    auth.db = auth.ConnectionManager(os.path.join(workdir, "register.db"))
+    timed("register_user (WAL, reused)", len(logins), threads, auth.register_user, logins)
+
+    # Previous behaviour: a new connection per call, rollback journal
+    naive_db = os.path.join(workdir, "naive.db")
+    conn = sqlite3.connect(naive_db)
+    auth._create_schema(conn)
+    conn.close()
+    timed("register_user (connect per call)", len(logins), threads,
+          lambda u, p: naive_register(naive_db, u, p), logins)
+    timed("verify_user (connect per call)", len(logins), threads,
+          lambda u, p: naive_verify(naive_db, u, p), logins)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+    run(args.users, args.threads)
+
+
+if __name__ == "__main__":
+    main()
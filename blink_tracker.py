@@ -0,0 +1,328 @@
+"""Per-session blink counting from an eye-aspect-ratio (EAR) time series.
+
+``BlinkDetector.eye_blink`` keeps its frame counter inside the detector and
+decides per frame in Python, so counts depend on whatever the detector saw
+before the current challenge. A ``BlinkTracker`` holds that state explicitly:
+EAR values go into a fixed-size NumPy ring buffer, are smoothed with a short
+moving average and turned into blink events with hysteresis (the eye is
+"closed" below ``close_threshold`` and only "open" again above
+``open_threshold``). Feeding the same EAR sequence always gives the same
+count, so challenges can be replayed and tested offline.
+
+``BlinkTrackerBank`` runs the same logic for many sessions at once, with one
+row per session and every update vectorized across sessions.
+"""
+import cv2 as cv
+import numpy as np
+
+# 68-point landmark indices of the eyes (dlib / iBUG layout)
+LEFT_EYE = slice(42, 48)
+RIGHT_EYE = slice(36, 42)
+
+OPEN, CLOSED = 1, 0
+
+
+def eye_aspect_ratio(eye):
+    """EAR of one or more eyes given as (..., 6, 2) landmark arrays."""
+    eye = np.asarray(eye, dtype=np.float32)
+    vertical = (
+        np.linalg.norm(eye[..., 1, :] - eye[..., 5, :], axis=-1)
+        + np.linalg.norm(eye[..., 2, :] - eye[..., 4, :], axis=-1)
+    )
+    horizontal = np.linalg.norm(eye[..., 0, :] - eye[..., 3, :], axis=-1)
+    return vertical / np.maximum(2.0 * horizontal, 1e-6)
+
+
+def landmarks_ear(landmarks):
+    """Mean EAR of both eyes from (..., 68, 2) landmarks."""
+    landmarks = np.asarray(landmarks, dtype=np.float32)
+    return (eye_aspect_ratio(landmarks[..., LEFT_EYE, :]) + eye_aspect_ratio(landmarks[..., RIGHT_EYE, :])) / 2
+
+
+def detector_ear(detector, rgb_image, box):
+    """EAR for the face in ``box`` using the detector's dlib shape predictor."""
+    import dlib
+
+    gray = cv.cvtColor(rgb_image, cv.COLOR_RGB2GRAY)
+    x1, y1, x2, y2 = (int(round(v)) for v in box[:4])
+    shape = detector.predictor(gray, dlib.rectangle(x1, y1, x2, y2))
+    points = np.array([(shape.part(i).x, shape.part(i).y) for i in range(68)], dtype=np.float32)
+    return float(landmarks_ear(points))
+
+
+class BlinkTracker:
+    """Counts blinks for one session.
+
+    Parameters:
+        capacity (int): Number of recent EAR values kept in the ring buffer.
+        smoothing (int): Width of the trailing moving average.
+        close_threshold (float): Smoothed EAR below which the eye is closed.
+        open_threshold (float): Smoothed EAR above which it is open again.
+        min_closed_frames (int): Shorter closures are treated as noise.
+    """
+
+    def __init__(self, capacity=64, smoothing=3, close_threshold=0.20,
+                 open_threshold=0.24, min_closed_frames=2):
+        if open_threshold < close_threshold:
+            raise ValueError("open_threshold must not be below close_threshold")
+        if not 1 <= smoothing <= capacity:
+            raise ValueError("smoothing must be between 1 and capacity")
+        self.capacity = capacity
+        self.smoothing = smoothing
+        self.close_threshold = close_threshold
+        self.open_threshold = open_threshold
+        self.min_closed_frames = min_closed_frames
+        self._ears = np.zeros(capacity, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        """Clears the history and count, e.g. when a new challenge starts."""
+        self._ears.fill(0)
+        self._index = 0
+        self.frames = 0
+        self.blinks = 0
+        self._window_sum = 0.0
+        self._state = OPEN
+        self._closed_run = 0
+
+    def update(self, ear):
+        """Adds one frame's EAR. Returns the number of blinks it completed (0 or 1)."""
+        # Rounded like the buffer so the running sum and update_many agree
+        ear = float(np.float32(ear))
+        # Running sum of the last `smoothing` values, read off the ring buffer
+        if self.frames >= self.smoothing:
+            self._window_sum -= float(self._ears[(self._index - self.smoothing) % self.capacity])
+        self._window_sum += ear
+        self._ears[self._index] = ear
+        self._index = (self._index + 1) % self.capacity
+        self.frames += 1
+
+        smoothed = self._window_sum / min(self.frames, self.smoothing)
+        completed = 0
+        if self._state == OPEN:
+            if smoothed < self.close_threshold:
+                self._state = CLOSED
+                self._closed_run = 1
+        elif smoothed > self.open_threshold:
+            if self._closed_run >= self.min_closed_frames:
+                completed = 1
+            self._state = OPEN
+            self._closed_run = 0
+        else:
+            self._closed_run += 1
+        self.blinks += completed
+        return completed
+
+    def update_many(self, ears):
+        """Adds a batch of EAR values in one vectorized pass.
+
+        Gives the same state and count as calling ``update`` on each value.
+        Returns the number of blinks completed within the batch.
+        """
+        ears = np.asarray(ears, dtype=np.float32).reshape(-1)
+        n = ears.size
+        if n == 0:
+            return 0
+
+        # Moving average over the tail of the history followed by the batch
+        history = self.recent(self.smoothing - 1)
+        series = np.concatenate([history, ears]).astype(np.float64)
+        cumsum = np.concatenate([[0.0], np.cumsum(series)])
+        end = np.arange(history.size + 1, series.size + 1)
+        start = np.maximum(end - self.smoothing, 0)
+        smoothed = (cumsum[end] - cumsum[start]) / (end - start)
+
+        state, closed_run, completed = _hysteresis(
+            smoothed, self._state, self._closed_run,
+            self.close_threshold, self.open_threshold, self.min_closed_frames,
+        )
+        self._state, self._closed_run = state, closed_run
+
+        # Write the batch into the ring buffer
+        keep = ears[-self.capacity:]
+        positions = (self._index + n - keep.size + np.arange(keep.size)) % self.capacity
+        self._ears[positions] = keep
+        self._index = (self._index + n) % self.capacity
+        self.frames += n
+        window = self.recent(self.smoothing)
+        self._window_sum = float(window.sum(dtype=np.float64))
+
+        self.blinks += completed
+        return completed
+
+    def recent(self, count=None):
+        """The last ``count`` EAR values (default: all retained), oldest first."""
+        available = min(self.frames, self.capacity)
+        count = available if count is None else min(count, available)
+        if count <= 0:
+            return np.empty(0, dtype=np.float32)
+        positions = (self._index - count + np.arange(count)) % self.capacity
+        return self._ears[positions]
+
+    def done(self, required):
+        return self.blinks >= required
+
+
+def _hysteresis(smoothed, state, closed_run, close_threshold, open_threshold, min_closed_frames):
+    """Vectorized hysteresis over a smoothed EAR batch.
+
+    Frames below ``close_threshold`` force CLOSED, frames above
+    ``open_threshold`` force OPEN, and frames in between keep the previous
+    state (a forward fill). A blink is a CLOSED -> OPEN transition whose
+    closed run lasted at least ``min_closed_frames`` frames.
+
+    Returns:
+        tuple: (final state, final closed run length, completed blinks)
+    """
+    n = smoothed.size
+    # Candidate state per frame; -1 means "keep previous"
+    forced = np.full(n, -1, dtype=np.int8)
+    forced[smoothed > open_threshold] = OPEN
+    # The open check only applies while closed and the close check while
+    # open; with open_threshold >= close_threshold they never overlap
+    forced[smoothed < close_threshold] = CLOSED
+
+    # Forward fill: index of the latest forcing frame at or before each frame
+    marks = np.where(forced >= 0, np.arange(n), -1)
+    last = np.maximum.accumulate(marks)
+    states = np.where(last >= 0, forced[np.maximum(last, 0)], state).astype(np.int8)
+
+    previous = np.concatenate([[state], states[:-1]])
+    closing = np.flatnonzero((previous == OPEN) & (states == CLOSED))
+    opening = np.flatnonzero((previous == CLOSED) & (states == OPEN))
+
+    # Length of each closed run that ends in an opening. Runs that started
+    # before this batch carry over ``closed_run`` frames.
+    run_starts = np.searchsorted(closing, opening, side="right") - 1
+    run_closed_at = np.concatenate([closing, [0]])[np.maximum(run_starts, 0)]
+    lengths = np.where(run_starts >= 0, opening - run_closed_at, opening + closed_run)
+    completed = int(np.count_nonzero(lengths >= min_closed_frames))
+
+    final_state = int(states[-1])
+    if final_state == CLOSED:
+        if closing.size and (not opening.size or closing[-1] > opening[-1]):
+            closed_run = n - closing[-1]
+        else:
+            closed_run = closed_run + n
+    else:
+        closed_run = 0
+    return final_state, int(closed_run), completed
+
+
+class BlinkTrackerBank:
+    """Blink trackers for many concurrent sessions in shared arrays.
+
+    Each session owns one row of a (sessions, capacity) EAR matrix. ``update``
+    takes one EAR per listed session and advances all of them with array
+    operations instead of a Python loop over sessions.
+    """
+
+    def __init__(self, capacity=64, smoothing=3, close_threshold=0.20,
+                 open_threshold=0.24, min_closed_frames=2, initial_sessions=16):
+        if open_threshold < close_threshold:
+            raise ValueError("open_threshold must not be below close_threshold")
+        if not 1 <= smoothing <= capacity:
+            raise ValueError("smoothing must be between 1 and capacity")
+        self.capacity = capacity
+        self.smoothing = smoothing
+        self.close_threshold = close_threshold
+        self.open_threshold = open_threshold
+        self.min_closed_frames = min_closed_frames
+        self._rows = {}
+        self._free = []
+        self._allocate(initial_sessions)
+
+    def _allocate(self, rows):
+        self._ears = np.zeros((rows, self.capacity), dtype=np.float32)
+        self._index = np.zeros(rows, dtype=np.int64)
+        self._frames = np.zeros(rows, dtype=np.int64)
+        self._window_sum = np.zeros(rows, dtype=np.float64)
+        self._state = np.full(rows, OPEN, dtype=np.int8)
+        self._closed_run = np.zeros(rows, dtype=np.int64)
+        self._blinks = np.zeros(rows, dtype=np.int64)
+        self._free = list(range(rows - 1, -1, -1))
+
+    def _grow(self):
+        old = len(self._index)
+        arrays = ("_ears", "_index", "_frames", "_window_sum", "_state", "_closed_run", "_blinks")
+        saved = {name: getattr(self, name) for name in arrays}
+        self._allocate(old * 2)
+        for name, values in saved.items():
+            getattr(self, name)[:old] = values
+        self._free = list(range(old * 2 - 1, old - 1, -1))
+
+    def _row(self, session_id):
+        row = self._rows.get(session_id)
+        if row is None:
+            if not self._free:
+                self._grow()
+            row = self._free.pop()
+            self._rows[session_id] = row
+            self._clear(row)
+        return row
+
+    def _clear(self, row):
+        self._ears[row] = 0
+        self._index[row] = 0
+        self._frames[row] = 0
+        self._window_sum[row] = 0
+        self._state[row] = OPEN
+        self._closed_run[row] = 0
+        self._blinks[row] = 0
+
+    def reset(self, session_id):
+        """Starts a new challenge for ``session_id``."""
+        self._clear(self._row(session_id))
+
+    def remove(self, session_id):
+        row = self._rows.pop(session_id, None)
+        if row is not None:
+            self._free.append(row)
+
+    def __contains__(self, session_id):
+        return session_id in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def blinks(self, session_id):
+        row = self._rows.get(session_id)
+        return 0 if row is None else int(self._blinks[row])
+
+    def update(self, session_ids, ears):
+        """Adds one EAR per session (sessions must be distinct).
+
+        Returns:
+            np.ndarray: Blinks completed by this frame, per session (0 or 1).
+        """
+        rows = np.fromiter((self._row(s) for s in session_ids), dtype=np.int64)
+        ears = np.asarray(ears, dtype=np.float32).reshape(-1)
+        if rows.size != ears.size:
+            raise ValueError("one EAR value per session is required")
+
+        # Trailing moving average from each row's running window sum
+        frames = self._frames[rows]
+        index = self._index[rows]
+        dropping = frames >= self.smoothing
+        dropped = self._ears[rows, (index - self.smoothing) % self.capacity]
+        self._window_sum[rows] += ears - np.where(dropping, dropped, 0)
+        self._ears[rows, index] = ears
+        self._index[rows] = (index + 1) % self.capacity
+        frames = frames + 1
+        self._frames[rows] = frames
+        smoothed = self._window_sum[rows] / np.minimum(frames, self.smoothing)
+
+        # Hysteresis, one step for every session at once
+        state = self._state[rows]
+        closed_run = self._closed_run[rows]
+        closing = (state == OPEN) & (smoothed < self.close_threshold)
+        opening = (state == CLOSED) & (smoothed > self.open_threshold)
+        staying_closed = (state == CLOSED) & ~opening
+
+        completed = (opening & (closed_run >= self.min_closed_frames)).astype(np.int64)
+        self._state[rows] = np.where(closing, CLOSED, np.where(opening, OPEN, state))
+        self._closed_run[rows] = np.where(
+            closing, 1, np.where(staying_closed, closed_run + 1, 0)
+        )
+        self._blinks[rows] += completed
+        return completed
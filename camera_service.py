@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class CameraService:
+    """Single long-lived camera shared by every page of the GUI.
+
+    The device is opened once and read continuously on a background thread.
+    Pages subscribe while they are visible and read the latest frame; when
+    the last subscriber leaves, capture keeps running for ``idle_timeout``
+    seconds (so exposure stays settled across a page switch) and then pauses.
+    The device itself is only released after ``release_timeout`` idle seconds,
+    if set, or by ``close()``.
+    """
+
+    def __init__(self, source=0, idle_timeout=10.0, release_timeout=None,
+                 capture_factory=cv.VideoCapture):
+        self.source = source
+        self.idle_timeout = idle_timeout
+        self.release_timeout = release_timeout
+        self.capture_factory = capture_factory
+
+        self._capture = None
+        self._frame = None
+        self._subscribers = {}
+        self._next_token = 0
+        self._idle_since = time.monotonic()
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="camera-service", daemon=True)
+        self._thread.start()
+
+    def subscribe(self, callback=None):
+        """Registers a subscriber and resumes capture.
+
+        ``callback(frame)``, if given, is called on the capture thread for
+        every new frame. Returns a token for ``unsubscribe``.
+        """
+        with self._cond:
+            token = self._next_token
+            self._next_token += 1
+            self._subscribers[token] = callback
+            self._cond.notify_all()
+            return token
+
+    def unsubscribe(self, token):
+        with self._cond:
+            self._subscribers.pop(token, None)
+            if not self._subscribers:
+                self._idle_since = time.monotonic()
+
+    def read(self, wait_timeout=1.0):
+        """Returns ``(ok, frame)`` with the most recent frame, like VideoCapture.read."""
+        with self._cond:
+            if self._frame is None:
+                self._cond.wait_for(lambda: self._frame is not None or self._closed, wait_timeout)
+            if self._frame is None:
+                return False, None
+            return True, self._frame
+
+    def is_opened(self):
+        with self._cond:
+            return self._capture is not None and self._capture.isOpened()
+
+    def client(self):
+        """Returns a VideoCapture-like handle for one page."""
+        return CameraClient(self)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=2.0)
+
+    def _capturing(self):
+        return bool(self._subscribers) or time.monotonic() - self._idle_since < self.idle_timeout
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and not self._capturing():
+                    # Paused: never hand out a frame from before the pause
+                    self._frame = None
+                    self._maybe_release()
+                    self._cond.wait(timeout=1.0)
+                if self._closed:
+                    break
+                callbacks = [cb for cb in self._subscribers.values() if cb is not None]
+
+            if self._capture is None:
+                logger.info(f"Opening camera {self.source}")
+                self._capture = self.capture_factory(self.source)
+
+            ok, frame = self._capture.read()
+            if not ok:
+                time.sleep(0.01)
+                continue
+
+            with self._cond:
+                self._frame = frame
+                self._cond.notify_all()
+            for callback in callbacks:
+                try:
+                    callback(frame)
+                except Exception as e:
+                    logger.error(f"Camera subscriber failed: {e}")
+
+        self._release()
+
+    def _maybe_release(self):
+        idle_for = time.monotonic() - self._idle_since
+        if self.release_timeout is not None and self._capture is not None and idle_for >= self.release_timeout:
+            logger.info(f"Releasing camera {self.source} after {idle_for:.0f}s idle")
+            self._release()
+
+    def _release(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+            self._frame = None
+
+
+class CameraClient:
+    """Per-page view of a CameraService with the cv.VideoCapture interface.
+
+    ``open``/``release`` subscribe and unsubscribe instead of touching the
+    device, so pages written against VideoCapture switch instantly.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self._token = None
+
+    def open(self, *args, **kwargs):
+        if self._token is None:
+            self._token = self.service.subscribe()
+        return True
+
+    def release(self):
+        if self._token is not None:
+            self.service.unsubscribe(self._token)
+            self._token = None
+
+    def isOpened(self):
+        return self.service.is_opened()
+
+    def read(self, image=None):
+        # Frames are shared with the capture thread; with a destination buffer
+        # the frame is copied into it instead of handing out the shared array
+        ok, frame = self.service.read()
+        if ok and image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return ok, image
+        return ok, frame
@@ -1,10 +1,17 @@
+import os
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2 as cv
 import numpy as np
 import torch
 
+from blink_tracker import BlinkTracker, detector_ear
+from evidence_archive import EvidenceArchiver
 from facenet.models.mtcnn import MTCNN
+from frame_pipeline import FramePreprocessor, allocation_counter
+from inference_governor import InferenceGovernor
+from profiling import profiler, span
 from liveness_detection.blink_detection import *
 from liveness_detection.emotion_prediction import *
 from liveness_detection.face_orientation import *
@@ -46,12 +53,27 @@ def get_challenge_and_question():
     return challenge, question
 
 
-def blink_response(image, box, question, model: BlinkDetector):
+def blink_response(image, box, question, model: BlinkDetector, tracker: BlinkTracker = None):
+    """
+    Check whether the required number of blinks has been reached.
 
+    With a ``tracker`` the blink count lives in the tracker (reset it when a
+    new challenge starts) and the detector only supplies the eye landmarks.
+    Without one, the detector's own ``eye_blink`` counter is used.
+    """
     thresh = question[1]
-    blink_success = model.eye_blink(image, box, thresh)
+    if tracker is None:
+        return model.eye_blink(image, box, thresh)
+
+    tracker.update(detector_ear(model, image, box))
+    return tracker.done(thresh)
 
-    return blink_success
+
+def detect_face_box(frame: np.ndarray, mtcnn: MTCNN):
+    """Face box as result_challenge_response() finds it, or None."""
+    with span("extract_face"):
+        _, box, _ = extract_face(frame, mtcnn, padding=10)
+    return box
 
 
 def face_response(challenge: str, landmarks: list, model: FaceOrientationDetector):
@@ -69,7 +91,8 @@ def emotion_response(face, challenge: str, model: EmotionPredictor):
 
 
 def result_challenge_response(
-    frame: np.ndarray, challenge: str, question, model: list, mtcnn: MTCNN
+    frame: np.ndarray, challenge: str, question, model: list, mtcnn: MTCNN,
+    blink_tracker: BlinkTracker = None,
 ):
     """
     Process the response to a challenge based on the input frame.
@@ -80,20 +103,25 @@ def result_challenge_response(
         question:  A question or instruction related to the challenge.
         model (list): List of models used, including [blink_model, face_orientation_model, emotion_model].
         mtcnn (MTCNN): MTCNN object used for face extraction.
+        blink_tracker (BlinkTracker, optional): Per-session blink state for 'blink eyes'.
 
     Returns:
         bool: The result of the challenge (True if correct, False if incorrect).
     """
-    face, box, landmarks = extract_face(frame, mtcnn, padding=10)
+    with span("extract_face"):
+        face, box, landmarks = extract_face(frame, mtcnn, padding=10)
     if box is not None:
         if challenge in ["smile", "surprise"]:
-            isCorrect = emotion_response(face, challenge, model[2])
+            with span("liveness.emotion"):
+                isCorrect = emotion_response(face, challenge, model[2])
 
         elif challenge in ["right", "left", "front"]:
-            isCorrect = face_response(challenge, landmarks, model[1])
+            with span("liveness.orientation"):
+                isCorrect = face_response(challenge, landmarks, model[1])
 
         elif challenge == "blink eyes":
-            isCorrect = blink_response(frame, box, question, model[0])
+            with span("liveness.blink"):
+                isCorrect = blink_response(frame, box, question, model[0], blink_tracker)
 
         return isCorrect
     return False
@@ -114,19 +142,81 @@ if __name__ == "__main__":
 
     challenge, question = get_challenge_and_question()
     challengeIsCorrect = False
+    blink_tracker = BlinkTracker()
+
+    # Frames are read, mirrored and color-converted into reused buffers
+    preprocessor = FramePreprocessor()
+
+    # The preview runs every frame; analysis only as often as the machine
+    # allows, on a worker thread so inference does not stall the preview
+    governor = InferenceGovernor(target_fps=30, max_decision_latency=0.5)
+    analysis_pool = ThreadPoolExecutor(max_workers=1)
+    pending = None
+    pending_frame = None
+    pending_round = None
+    challenge_round = 0
+    face_box = None
+
+    # Each run of LIVENESS_CHALLENGES answered challenges is archived as one
+    # evidence session, with the frame and verdict of every challenge
+    evidence = EvidenceArchiver(os.getenv("EVIDENCE_DIR", "evidence"))
+    required = int(os.getenv("LIVENESS_CHALLENGES", 3))
+    session = evidence.begin_session(source="challenge_response")
+    passed = 0
 
     count = 0
     while True:
-        ret, frame = video.read()
+        frame_start = governor.clock()
+        ret, frame, rgb_frame = preprocessor.read(video)
 
         if ret:
-            frame = cv.flip(frame, 1)
             if challengeIsCorrect is False:
-
-                rgb_frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
-                challengeIsCorrect = result_challenge_response(
-                    rgb_frame, challenge, question, model, mtcnn
-                )
+                blinking = challenge == "blink eyes"
+
+                if pending is not None and pending.done():
+                    result = pending.result()
+                    governor.finish_analysis()
+                    # A result for the previous challenge is dropped
+                    if pending_round == challenge_round:
+                        if blinking:
+                            face_box = result
+                        else:
+                            challengeIsCorrect = result
+                            analyzed = pending_frame
+                    pending = pending_frame = None
+
+                if pending is None and not challengeIsCorrect and governor.should_analyze():
+                    governor.start_analysis()
+                    # rgb_frame is a reused buffer; the worker gets its own copy
+                    pending_frame = rgb_frame.copy()
+                    pending_round = challenge_round
+                    if blinking:
+                        # Only the face box; the eyes are sampled below
+                        pending = analysis_pool.submit(detect_face_box, pending_frame, mtcnn)
+                    else:
+                        pending = analysis_pool.submit(
+                            result_challenge_response,
+                            pending_frame, challenge, question, model, mtcnn,
+                        )
+
+                if blinking and face_box is not None:
+                    # BlinkTracker counts closures in frames, so the eyes are
+                    # sampled on every frame. Only the dlib landmarks run here,
+                    # on the last box MTCNN found on the governor's schedule.
+                    with span("liveness.blink"):
+                        challengeIsCorrect = blink_response(
+                            rgb_frame, face_box, question, model[0], blink_tracker
+                        )
+                    analyzed = rgb_frame
+
+                if challengeIsCorrect:
+                    session.add_frame("liveness", analyzed, copy=analyzed is rgb_frame, challenge=challenge)
+                    session.add_verdict("liveness", True, challenge=challenge)
+                    passed += 1
+                    if passed >= required:
+                        session.close("passed")
+                        session = evidence.begin_session(source="challenge_response")
+                        passed = 0
 
                 if isinstance(question, list):
                     cv.putText(
@@ -150,7 +240,14 @@ if __name__ == "__main__":
                     )
 
             cv.imshow("", frame)
+            governor.record_frame(frame_start, governor.clock())
             if cv.waitKey(1) & 0xFF == ord("q"):
+                print("Frame buffer allocations:", dict(allocation_counter.by_site))
+                print("Governor:", governor.stats())
+                analysis_pool.shutdown(wait=True)
+                if profiler.enabled:
+                    print(profiler.format_stats())
+                    profiler.export_chrome_trace("challenge_trace.json")
                 break
 
             count += 1
@@ -159,7 +256,14 @@ if __name__ == "__main__":
                 challenge, question = get_challenge_and_question()
                 print(question)
                 challengeIsCorrect = False
+                blink_tracker.reset()
+                face_box = None
+                challenge_round += 1
 
                 count = 0
         else:
             break
+
+    # A run left before its last challenge
+    session.close("abandoned")
+    evidence.close()
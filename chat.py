@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, render_template, session
+from flask import Flask, Response, g, request, jsonify, render_template, session
 from gtts import gTTS
 import os
 import requests
@@ -6,22 +6,31 @@ import json
 import uuid
 from pymongo import MongoClient
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from dotenv import load_dotenv
 from datetime import datetime
 import logging
+import threading
+import time
 from flask_cors import CORS
+from conversation_store import ConversationStore, estimate_tokens
+from chat_storage import ChatCodec, decode_chat, full_projection, preview_of
+from persistence import WriteBehindWriter, init_schema
+from model_router import ModelRouter, ModelUnavailableError
+import metrics
+from logging_config import configure_logging, request_id_var
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
+# Configure logging: JSON lines written by a background listener thread
+configure_logging(
+    log_file=os.getenv("LOG_FILE", "app.log"),
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    rotation=os.getenv("LOG_ROTATION", "size"),
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+    backup_count=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+    when=os.getenv("LOG_ROTATE_WHEN", "midnight"),
 )
 logger = logging.getLogger(__name__)
 
@@ -30,18 +39,46 @@ CORS(app)
 
 app.secret_key = os.getenv("SECRET_KEY", os.urandom(24))
 
+@app.before_request
+def start_request():
+    # Reuse an upstream request id (e.g. from a proxy) when one is given
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    g.request_token = request_id_var.set(g.request_id)
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def finish_request(response):
+    duration_ms = (time.perf_counter() - g.request_start) * 1000
+    response.headers["X-Request-ID"] = g.request_id
+    logger.info(
+        f"{request.method} {request.path} {response.status_code}",
+        extra={
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 2),
+        }
+    )
+    return response
+
+@app.teardown_request
+def reset_request_id(exc):
+    token = g.pop("request_token", None)
+    if token is not None:
+        request_id_var.reset(token)
+
 # MongoDB Configuration
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DB_NAME = os.getenv("DB_NAME", "kyc_db")
 
 try:
-    client = MongoClient(MONGO_URI)
+    client = MongoClient(MONGO_URI, maxPoolSize=int(os.getenv("MONGO_POOL_SIZE", 100)))
     db = client[DB_NAME]
     users_collection = db['users']
     chats_collection = db['chats']
-    # Create indexes for faster queries
-    chats_collection.create_index([("user_id", 1)])
-    chats_collection.create_index([("timestamp", -1)])
+    conversations_collection = db['conversations']
+    # Collections and indexes are created once here, not per request
+    init_schema(db)
     logger.info("Successfully connected to MongoDB")
 except Exception as e:
     logger.error(f"MongoDB connection error: {e}")
@@ -52,10 +89,147 @@ GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/co
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "llama3-70b-8192")
 
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", 30))
+
+AVAILABLE_MODELS = [
+    {"id": "llama3-70b-8192", "name": "Llama 3 70B", "description": "High accuracy, best for complex KYC queries"},
+    {"id": "mixtral-8x7b-32768", "name": "Mixtral 8x7B", "description": "Fast responses with good accuracy"}
+]
+
+# Optional latency-aware routing across the available models. With
+# MODEL_ROUTING=hedged a slow turn is duplicated to the faster model after the
+# primary's percentile deadline, and models with repeated errors are skipped.
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "off").lower()
+
+def is_upstream_failure(exc):
+    """Only server errors, rate limits and transport errors trip a breaker."""
+    if isinstance(exc, GroqAPIError):
+        return exc.status_code >= 500 or exc.status_code == 429
+    return isinstance(exc, requests.exceptions.RequestException)
+
+model_router = None
+if MODEL_ROUTING == "hedged":
+    model_router = ModelRouter(
+        [m["id"] for m in AVAILABLE_MODELS],
+        hedge_percentile=float(os.getenv("HEDGE_PERCENTILE", 95)),
+        default_hedge_delay=float(os.getenv("HEDGE_DEFAULT_DELAY", 5)),
+        failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5)),
+        reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30)),
+        is_failure=is_upstream_failure,
+    )
+
 if not GROQ_API_KEY:
     logger.error("GROQ_API_KEY is not set")
     raise ValueError("GROQ_API_KEY environment variable is required")
 
+# Shared HTTP session so concurrent chats reuse keep-alive connections to
+# Groq instead of doing a TLS handshake per turn. The pool is sized for the
+# number of in-flight chats one process serves (see gunicorn.conf.py).
+groq_session = requests.Session()
+groq_adapter = requests.adapters.HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=int(os.getenv("GROQ_POOL_SIZE", 100))
+)
+groq_session.mount("https://", groq_adapter)
+groq_session.mount("http://", groq_adapter)
+
+# Conversation context configuration. History lives server-side; only the
+# user_id is kept in the session cookie.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+MAX_STORED_MESSAGES = int(os.getenv("MAX_STORED_MESSAGES", 40))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", 400))
+
+# /history configuration
+HISTORY_MAX_LIMIT = int(os.getenv("HISTORY_MAX_LIMIT", 100))
+HISTORY_COUNT_TTL = float(os.getenv("HISTORY_COUNT_TTL", 30))
+HISTORY_PROJECTION = {
+    "user_input": 1,
+    "response_text": 1,
+    "language": 1,
+    "model": 1,
+    "timestamp": 1,
+    "audio_file": 1,
+}
+# List view: previews only, full bodies come from /history/<chat_id>
+HISTORY_PREVIEW_CHARS = int(os.getenv("HISTORY_PREVIEW_CHARS", 160))
+HISTORY_PREVIEW_PROJECTION = {
+    "user_input_preview": 1,
+    "response_preview": 1,
+    "language": 1,
+    "model": 1,
+    "timestamp": 1,
+    "audio_file": 1,
+}
+
+# Optional compression of large chat text fields (CHAT_COMPRESSION=zlib)
+chat_codec = ChatCodec(
+    compression=os.getenv("CHAT_COMPRESSION", "off").lower(),
+    min_bytes=int(os.getenv("CHAT_COMPRESS_MIN_BYTES", 1024)),
+    level=int(os.getenv("CHAT_COMPRESS_LEVEL", 6)),
+    preview_chars=HISTORY_PREVIEW_CHARS,
+)
+
+# Per-user cache of chat counts: user_id -> (total, expires_at)
+_history_count_cache = {}
+_history_count_lock = threading.Lock()
+
+# Metrics exposed on /metrics
+STAGE_SECONDS = metrics.Histogram(
+    "kyc_chat_stage_seconds",
+    "Latency of /chat stages (groq, tts, chat_total)",
+    ["stage", "model", "language"],
+)
+STAGE_ERRORS = metrics.Counter(
+    "kyc_chat_stage_errors_total",
+    "Errors in /chat stages",
+    ["stage", "model", "language"],
+)
+MONGO_SECONDS = metrics.Histogram(
+    "kyc_mongo_operation_seconds",
+    "Latency of MongoDB operations",
+    ["operation", "collection"],
+)
+MONGO_ERRORS = metrics.Counter(
+    "kyc_mongo_operation_errors_total",
+    "Failed MongoDB operations",
+    ["operation", "collection"],
+)
+CHAT_IN_FLIGHT = metrics.Gauge(
+    "kyc_chat_requests_in_flight",
+    "/chat requests currently being served",
+)
+GROQ_IN_FLIGHT = metrics.Gauge(
+    "kyc_groq_requests_in_flight",
+    "Groq API requests currently waiting for a response",
+    ["model"],
+)
+
+def record_mongo_write(collection_name, count, seconds, ok):
+    MONGO_SECONDS.labels("insert_many", collection_name).observe(seconds)
+    if not ok:
+        MONGO_ERRORS.labels("insert_many", collection_name).inc()
+
+def model_label(model):
+    # Model ids come from the client; keep label cardinality bounded
+    return model if any(m["id"] == model for m in AVAILABLE_MODELS) else "other"
+
+# Chat and feedback documents are written behind the request path in batches
+persistence_writer = WriteBehindWriter(
+    db,
+    batch_size=int(os.getenv("WRITE_BATCH_SIZE", 100)),
+    flush_interval=float(os.getenv("WRITE_FLUSH_INTERVAL", 0.5)),
+    max_queue=int(os.getenv("WRITE_QUEUE_SIZE", 10000)),
+    spill_path=os.getenv("MONGO_SPILL_PATH", "mongo_spill.jsonl"),
+    on_write=record_mongo_write,
+)
+persistence_writer.start()
+
+conversation_store = ConversationStore(
+    conversations_collection,
+    max_messages=MAX_STORED_MESSAGES,
+    summary_token_budget=SUMMARY_TOKEN_BUDGET,
+)
+
 # KYC-focused system prompt for Groq API
 def get_system_prompt(language="en"):
     if language == "hi":
@@ -152,12 +326,51 @@ def get_system_prompt(language="en"):
         You are helpful, direct, and focused on providing accurate KYC information that empowers users to implement effective compliance programs while protecting customer privacy.
         """
 
-def get_groq_response(prompt, conversation_history=None, language="en", model=DEFAULT_MODEL):
+class GroqAPIError(Exception):
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code}, {text}")
+        self.status_code = status_code
+
+def call_groq(messages, model, language="en"):
+    """Sends one completion request and returns the assistant message."""
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
     }
     
+    # Streamline settings and increase temperature slightly for more creative responses
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": 2048,
+        "top_p": 0.9,  # Add top_p parameter for better quality responses
+    }
+    
+    labels = (model_label(model), language)
+    logger.info(f"Sending request to Groq API with model: {model}")
+    try:
+        start = time.perf_counter()
+        with GROQ_IN_FLIGHT.labels(labels[0]).track_inprogress():
+            response = groq_session.post(GROQ_API_URL, headers=headers, json=data, timeout=GROQ_TIMEOUT)
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.labels("groq", *labels).observe(duration)
+        
+        if response.status_code != 200:
+            raise GroqAPIError(response.status_code, response.text)
+        
+        response_data = response.json()
+        logger.info(
+            f"Successfully received response from Groq API with model: {model}",
+            extra={"stage": "groq", "model": model, "language": language, "duration_ms": round(duration * 1000, 2)}
+        )
+        return response_data['choices'][0]['message']['content']
+    except Exception:
+        STAGE_ERRORS.labels("groq", *labels).inc()
+        raise
+
+def get_groq_response(prompt, conversation_history=None, language="en", model=DEFAULT_MODEL, context_summary=None):
+    """Returns (assistant message, updated conversation, model that answered)."""
     # Build messages including system prompt and conversation history
     messages = []
     
@@ -167,6 +380,13 @@ def get_groq_response(prompt, conversation_history=None, language="en", model=DE
         "content": get_system_prompt(language)
     })
     
+    # Add the rolling summary of turns that no longer fit the context budget
+    if context_summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{context_summary}"
+        })
+    
     # Add conversation history
     if conversation_history:
         # Skip the system message if it exists in the history
@@ -177,43 +397,37 @@ def get_groq_response(prompt, conversation_history=None, language="en", model=DE
     # Add the current user message
     messages.append({"role": "user", "content": prompt})
     
-    # Streamline settings and increase temperature slightly for more creative responses
-    data = {
-        "model": model,
-        "messages": messages,
-        "temperature": 0.7,
-        "max_tokens": 2048,
-        "top_p": 0.9,  # Add top_p parameter for better quality responses
-    }
-    
     try:
-        logger.info(f"Sending request to Groq API with model: {model}")
-        response = requests.post(GROQ_API_URL, headers=headers, json=data, timeout=30)
-        
-        if response.status_code != 200:
-            logger.error(f"Groq API Error: {response.status_code}, {response.text}")
-            return f"API Error: {response.status_code}. Please try again later.", []
-        
-        response_data = response.json()
-        logger.info("Successfully received response from Groq API")
-        
-        # Extract the response content and update conversation history
-        assistant_message = response_data['choices'][0]['message']['content']
+        served_model = model
+        if model_router:
+            assistant_message, served_model = model_router.call(
+                model, lambda m: call_groq(messages, m, language)
+            )
+            if served_model != model:
+                logger.info(f"Turn for {model} answered by {served_model}")
+        else:
+            assistant_message = call_groq(messages, model, language)
         
         # Update conversation history but don't include system message again
         new_messages = [msg for msg in messages if msg.get("role") != "system"]
         new_messages.append({"role": "assistant", "content": assistant_message})
         
-        return assistant_message, new_messages
+        return assistant_message, new_messages, served_model
+    except GroqAPIError as e:
+        logger.error(f"Groq API Error: {e}")
+        return f"API Error: {e.status_code}. Please try again later.", [], model
+    except ModelUnavailableError as e:
+        logger.error(f"Groq API Routing Error: {e}")
+        return "Sorry, I couldn't connect to the AI service at the moment. Please try again later.", [], model
     except requests.exceptions.RequestException as e:
         logger.error(f"Groq API Request Error: {e}")
-        return "Sorry, I couldn't connect to the AI service at the moment. Please try again later.", []
+        return "Sorry, I couldn't connect to the AI service at the moment. Please try again later.", [], model
     except (KeyError, IndexError, json.JSONDecodeError) as e:
         logger.error(f"Groq API Response Parsing Error: {e}")
-        return "Sorry, there was an issue processing the AI response. Please try again.", []
+        return "Sorry, there was an issue processing the AI response. Please try again.", [], model
 
 # Function to convert text to audio
-def text_to_audio(text, language="en"):
+def text_to_audio(text, language="en", model=DEFAULT_MODEL):
     if not text:
         logger.warning("Empty text provided for text-to-speech conversion")
         return None
@@ -237,13 +451,20 @@ def text_to_audio(text, language="en"):
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
         # Generate speech
+        start = time.perf_counter()
         tts = gTTS(text=text, lang=tts_lang, slow=False)
         tts.save(filepath)
-        logger.info(f"Audio file created: {filepath}")
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.labels("tts", model_label(model), language).observe(duration)
+        logger.info(
+            f"Audio file created: {filepath}",
+            extra={"stage": "tts", "model": model, "language": language, "duration_ms": round(duration * 1000, 2)}
+        )
         
         return f"/static/audio/{filename}"
     except Exception as e:
         logger.error(f"Text-to-Audio Error: {e}")
+        STAGE_ERRORS.labels("tts", model_label(model), language).inc()
         return None
 
 @app.route('/')
@@ -251,12 +472,16 @@ def index():
     # Initialize session if not already done
     if 'user_id' not in session:
         session['user_id'] = str(uuid.uuid4())
-        session['conversation'] = []
     
     return render_template('chat.html')
 
 @app.route('/chat', methods=['POST'])
 def chat():
+    with CHAT_IN_FLIGHT.labels().track_inprogress():
+        return handle_chat()
+
+def handle_chat():
+    start_time = time.perf_counter()
     data = request.json
     user_input = data.get('message')
     language = data.get('language', 'en')
@@ -266,36 +491,67 @@ def chat():
         language = 'en'  # Default to English if unsupported
         
     model = data.get('model', DEFAULT_MODEL)
-    user_id = session.get('user_id', str(uuid.uuid4()))
-    conversation_history = session.get('conversation', [])
+    if 'user_id' not in session:
+        session['user_id'] = str(uuid.uuid4())
+    user_id = session['user_id']
+    # History used to live in the cookie; drop it for existing sessions
+    session.pop('conversation', None)
     
     if not user_input:
         return jsonify({"error": "Message is required"}), 400
     
-    # Get response from Groq API
-    response_text, updated_conversation = get_groq_response(
+    # Assemble history under the token budget: recent turns verbatim,
+    # older ones as a rolling summary
+    reserved_tokens = estimate_tokens(get_system_prompt(language)) + estimate_tokens(user_input)
+    try:
+        with MONGO_SECONDS.labels("find_one", "conversations").time():
+            conversation_history, context_summary = conversation_store.build_context(
+                user_id, CONTEXT_TOKEN_BUDGET, reserved_tokens
+            )
+    except Exception as e:
+        logger.error(f"Failed to load conversation for user {user_id}: {e}")
+        MONGO_ERRORS.labels("find_one", "conversations").inc()
+        conversation_history, context_summary = [], ""
+    
+    # Get response from Groq API. With hedged routing another model may
+    # answer; everything below records the model that actually did.
+    response_text, updated_conversation, model = get_groq_response(
         user_input, 
         conversation_history,
         language,
-        model
+        model,
+        context_summary
     )
     
-    # Update session with new conversation history
-    session['conversation'] = updated_conversation
+    # Only successful turns are kept in the conversation store
+    if updated_conversation:
+        try:
+            with MONGO_SECONDS.labels("update_one", "conversations").time():
+                conversation_store.append_turn(user_id, user_input, response_text)
+        except Exception as e:
+            logger.error(f"Failed to save conversation for user {user_id}: {e}")
+            MONGO_ERRORS.labels("update_one", "conversations").inc()
+    
+    labels = (model_label(model), language)
     
     # Convert response to audio
-    audio_file = text_to_audio(response_text, language)
+    audio_file = text_to_audio(response_text, language, model)
     
     # Prepare response data
     response_data = {
         "response_text": response_text,
         "audio_url": audio_file if audio_file else None,
-        "language": language
+        "language": language,
+        "model": model
     }
     
-    # Save chat to MongoDB
+    # Save chat to MongoDB. The id is assigned here so the client can send
+    # feedback before the write-behind batch is flushed.
     timestamp = datetime.now()
+    chat_id = ObjectId()
+    response_data["chat_id"] = str(chat_id)
     chat_data = {
+        "_id": chat_id,
         "user_id": user_id,
         "user_input": user_input,
         "response_text": response_text,
@@ -305,14 +561,74 @@ def chat():
         "timestamp": timestamp
     }
     
-    try:
-        chats_collection.insert_one(chat_data)
-        logger.info(f"Chat saved to database for user: {user_id}")
-    except Exception as e:
-        logger.error(f"Failed to save chat to database: {e}")
+    persistence_writer.submit('chats', chat_codec.encode(chat_data))
+    invalidate_history_count(user_id)
+    logger.info(f"Chat queued for database for user: {user_id}")
     
+    duration = time.perf_counter() - start_time
+    STAGE_SECONDS.labels("chat_total", *labels).observe(duration)
+    logger.info(
+        "Chat completed",
+        extra={"stage": "chat_total", "model": model, "language": language, "duration_ms": round(duration * 1000, 2)}
+    )
     return jsonify(response_data)
 
+def get_history_count(user_id):
+    """Returns the user's chat count, cached for HISTORY_COUNT_TTL seconds."""
+    now = time.monotonic()
+    with _history_count_lock:
+        cached = _history_count_cache.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+    
+    with MONGO_SECONDS.labels("count_documents", "chats").time():
+        total = chats_collection.count_documents({"user_id": user_id})
+    with _history_count_lock:
+        _history_count_cache[user_id] = (total, now + HISTORY_COUNT_TTL)
+    return total
+
+def invalidate_history_count(user_id):
+    with _history_count_lock:
+        _history_count_cache.pop(user_id, None)
+
+def format_timestamp(timestamp):
+    return timestamp.isoformat() if isinstance(timestamp, datetime) else timestamp
+
+def fill_missing_previews(chats):
+    """Loads full text for chats stored before previews were written."""
+    missing = [chat['_id'] for chat in chats if 'response_preview' not in chat]
+    if not missing:
+        return
+    with MONGO_SECONDS.labels("find", "chats").time():
+        full = {
+            doc['_id']: decode_chat(doc)
+            for doc in chats_collection.find(
+                {"_id": {"$in": missing}},
+                full_projection({"user_input": 1, "response_text": 1})
+            )
+        }
+    for chat in chats:
+        if chat['_id'] in full:
+            chat.update(full[chat['_id']])
+
+def encode_history_cursor(chat):
+    timestamp = chat['timestamp']
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    return f"{timestamp},{chat['_id']}"
+
+def decode_history_cursor(cursor):
+    """Parses a ``<timestamp>,<id>`` cursor into a keyset filter."""
+    timestamp, chat_id = cursor.rsplit(',', 1)
+    timestamp = datetime.fromisoformat(timestamp)
+    chat_id = ObjectId(chat_id)
+    return {
+        "$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": chat_id}}
+        ]
+    }
+
 @app.route('/history', methods=['GET'])
 def chat_history():
     user_id = session.get('user_id')
@@ -320,48 +636,130 @@ def chat_history():
     if not user_id:
         return jsonify({"error": "No user session found"}), 401
     
-    # Get pagination parameters
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 10))
-    skip = (page - 1) * limit
+    # Get pagination parameters. `before` selects keyset pagination; `page`
+    # is kept for older clients and falls back to skip/limit.
+    before = request.args.get('before')
+    # view=preview returns truncated text; full bodies via /history/<chat_id>
+    view = request.args.get('view', 'full').lower()
+    if view not in ('full', 'preview'):
+        return jsonify({"error": "view must be 'full' or 'preview'"}), 400
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', 10)), 1), HISTORY_MAX_LIMIT)
+        query = {"user_id": user_id}
+        if before:
+            query.update(decode_history_cursor(before))
+    except (ValueError, TypeError, InvalidId):
+        return jsonify({"error": "Invalid pagination parameters"}), 400
+    
+    # Totals are on by default for page mode (older clients read them) and
+    # opt-in for cursor mode
+    include_total = request.args.get(
+        'include_total', 'false' if before else 'true'
+    ).lower() == 'true'
+    
+    # Read-your-writes: make sure this user's latest chats have landed
+    if persistence_writer.has_pending('chats', user_id):
+        persistence_writer.flush()
     
     try:
-        # Count total documents for pagination
-        total = chats_collection.count_documents({"user_id": user_id})
+        # Fetch one extra document to know whether another page exists
+        with MONGO_SECONDS.labels("find", "chats").time():
+            projection = HISTORY_PREVIEW_PROJECTION if view == 'preview' else full_projection(HISTORY_PROJECTION)
+            chats = chats_collection.find(
+                query, projection
+            ).sort(
+                [("timestamp", -1), ("_id", -1)]
+            )
+            if not before and page > 1:
+                chats = chats.skip((page - 1) * limit)
+            chats = list(chats.limit(limit + 1))
         
-        # Query chats with pagination and sorting
-        chats = chats_collection.find(
-            {"user_id": user_id}
-        ).sort(
-            "timestamp", -1
-        ).skip(skip).limit(limit)
+        has_more = len(chats) > limit
+        chats = chats[:limit]
         
         # Format chat data
+        if view == 'preview':
+            fill_missing_previews(chats)
         chat_list = []
         for chat in chats:
-            chat_list.append({
+            item = {
                 "id": str(chat['_id']),
-                "user_input": chat['user_input'],
-                "response_text": chat['response_text'],
                 "language": chat['language'],
                 "model": chat.get('model', DEFAULT_MODEL),
-                "timestamp": chat['timestamp'].isoformat() if isinstance(chat['timestamp'], datetime) else chat['timestamp'],
+                "timestamp": format_timestamp(chat['timestamp']),
                 "audio_url": chat.get('audio_file')
-            })
+            }
+            if view == 'preview':
+                item["user_input_preview"] = preview_of(chat, 'user_input', HISTORY_PREVIEW_CHARS)
+                item["response_preview"] = preview_of(chat, 'response_text', HISTORY_PREVIEW_CHARS)
+            else:
+                decode_chat(chat)
+                item["user_input"] = chat['user_input']
+                item["response_text"] = chat['response_text']
+            chat_list.append(item)
+        
+        pagination = {
+            "limit": limit,
+            "has_more": has_more,
+            "next_cursor": encode_history_cursor(chats[-1]) if has_more else None
+        }
+        if not before:
+            pagination["page"] = page
+        if include_total:
+            total = get_history_count(user_id)
+            pagination["total"] = total
+            pagination["pages"] = (total + limit - 1) // limit
         
         return jsonify({
             "chats": chat_list,
-            "pagination": {
-                "total": total,
-                "page": page,
-                "limit": limit,
-                "pages": (total + limit - 1) // limit
-            }
+            "pagination": pagination
         })
     except Exception as e:
         logger.error(f"Error retrieving chat history: {e}")
+        MONGO_ERRORS.labels("find", "chats").inc()
         return jsonify({"error": "Failed to retrieve chat history"}), 500
 
+@app.route('/history/<chat_id>', methods=['GET'])
+def chat_detail(chat_id):
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({"error": "No user session found"}), 401
+    
+    try:
+        chat_oid = ObjectId(chat_id)
+    except (InvalidId, TypeError):
+        return jsonify({"error": "Invalid chat id"}), 400
+    
+    if persistence_writer.has_pending('chats', user_id):
+        persistence_writer.flush()
+    
+    try:
+        with MONGO_SECONDS.labels("find_one", "chats").time():
+            chat = chats_collection.find_one(
+                {"_id": chat_oid, "user_id": user_id},
+                full_projection(HISTORY_PROJECTION)
+            )
+    except Exception as e:
+        logger.error(f"Error retrieving chat {chat_id}: {e}")
+        MONGO_ERRORS.labels("find_one", "chats").inc()
+        return jsonify({"error": "Failed to retrieve chat"}), 500
+    
+    if chat is None:
+        return jsonify({"error": "Chat not found"}), 404
+    
+    decode_chat(chat)
+    return jsonify({
+        "id": str(chat['_id']),
+        "user_input": chat['user_input'],
+        "response_text": chat['response_text'],
+        "language": chat['language'],
+        "model": chat.get('model', DEFAULT_MODEL),
+        "timestamp": format_timestamp(chat['timestamp']),
+        "audio_url": chat.get('audio_file')
+    })
+
 @app.route('/clear-history', methods=['POST'])
 def clear_history():
     user_id = session.get('user_id')
@@ -370,8 +768,13 @@ def clear_history():
         return jsonify({"error": "No user session found"}), 401
     
     try:
+        if persistence_writer.has_pending('chats', user_id):
+            persistence_writer.flush()
         result = chats_collection.delete_many({"user_id": user_id})
-        session['conversation'] = []
+        conversation_store.clear(user_id)
+        invalidate_history_count(user_id)
+        # Drop the history cookie left by older versions of the app
+        session.pop('conversation', None)
         
         return jsonify({
             "success": True,
@@ -384,12 +787,11 @@ def clear_history():
 @app.route('/models', methods=['GET'])
 def get_models():
     # List of only the best 2 models
-    models = [
-        {"id": "llama3-70b-8192", "name": "Llama 3 70B", "description": "High accuracy, best for complex KYC queries"},
-        {"id": "mixtral-8x7b-32768", "name": "Mixtral 8x7B", "description": "Fast responses with good accuracy"}
-    ]
+    response = {"models": AVAILABLE_MODELS}
+    if model_router:
+        response["routing"] = model_router.snapshot()
     
-    return jsonify({"models": models})
+    return jsonify(response)
 
 @app.route('/languages', methods=['GET'])
 def get_languages():
@@ -414,14 +816,9 @@ def submit_feedback():
         return jsonify({"error": "Missing required parameters"}), 400
     
     try:
-        # Create feedback collection if it doesn't exist
-        if 'feedback' not in db.list_collection_names():
-            db.create_collection('feedback')
-            db['feedback'].create_index([("user_id", 1)])
-            db['feedback'].create_index([("chat_id", 1)])
-        
         # Save feedback
         feedback_data = {
+            "_id": ObjectId(),
             "user_id": user_id,
             "chat_id": chat_id,
             "rating": rating,
@@ -429,7 +826,7 @@ def submit_feedback():
             "timestamp": datetime.now()
         }
         
-        db['feedback'].insert_one(feedback_data)
+        persistence_writer.submit('feedback', feedback_data)
         
         return jsonify({"success": True, "message": "Feedback submitted successfully"})
     except Exception as e:
@@ -445,6 +842,10 @@ def server_error(e):
     logger.error(f"Server error: {e}")
     return render_template('500.html'), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     try:
@@ -472,4 +873,5 @@ if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
     
     logger.info(f"Starting KYC Assistant application on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=os.getenv("FLASK_DEBUG", "False").lower() == "true")
\ No newline at end of file
+    logger.warning("Development server in use; run 'gunicorn -c gunicorn.conf.py wsgi:app' in production")
+    app.run(host='0.0.0.0', port=port, debug=os.getenv("FLASK_DEBUG", "False").lower() == "true")
\ No newline at end of file
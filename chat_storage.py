@@ -0,0 +1,93 @@
+"""Storage format for documents in the ``chats`` collection.
+
+Every chat is written with short previews of the user input and the response
+(``user_input_preview`` / ``response_preview``) so the /history list view
+can be served through a projection that never loads the full bodies.
+
+With compression enabled, text fields larger than ``min_bytes`` are stored
+zlib-compressed as BSON binary under ``<field>_z`` instead of ``<field>``.
+Long Hindi and Tamil responses are three bytes per character in UTF-8 and
+compress well. Documents written before compression was enabled (or below
+the threshold) keep their plain fields; ``decode_chat`` handles both.
+"""
+import zlib
+
+from bson.binary import Binary
+
+COMPRESSED_FIELDS = ("user_input", "response_text")
+PREVIEW_FIELDS = {"user_input": "user_input_preview", "response_text": "response_preview"}
+CODECS = ("off", "zlib")
+
+
+def make_preview(text, chars):
+    """Returns the first ``chars`` characters of ``text``, with an ellipsis if cut."""
+    if not text:
+        return text or ""
+    if len(text) <= chars:
+        return text
+    return text[:chars].rstrip() + "…"
+
+
+class ChatCodec:
+    def __init__(self, compression="off", min_bytes=1024, level=6, preview_chars=160):
+        if compression not in CODECS:
+            raise ValueError(f"Unsupported chat compression: {compression}")
+        self.compression = compression
+        self.min_bytes = min_bytes
+        self.level = level
+        self.preview_chars = preview_chars
+
+    def encode(self, chat):
+        """Returns a copy of ``chat`` ready for insertion."""
+        doc = dict(chat)
+        for field, preview_field in PREVIEW_FIELDS.items():
+            doc[preview_field] = make_preview(doc.get(field), self.preview_chars)
+
+        if self.compression == "off":
+            return doc
+
+        compressed = []
+        for field in COMPRESSED_FIELDS:
+            text = doc.get(field)
+            if not text:
+                continue
+            raw = text.encode("utf-8")
+            if len(raw) < self.min_bytes:
+                continue
+            packed = zlib.compress(raw, self.level)
+            # Not worth it for text that barely compresses
+            if len(packed) >= len(raw):
+                continue
+            doc[f"{field}_z"] = Binary(packed)
+            del doc[field]
+            compressed.append(field)
+        if compressed:
+            doc["compression"] = self.compression
+        return doc
+
+
+def full_projection(base):
+    """Extends a projection so compressed variants of its text fields load too."""
+    projection = dict(base)
+    for field in COMPRESSED_FIELDS:
+        if projection.get(field):
+            projection[f"{field}_z"] = 1
+    return projection
+
+
+def decode_chat(doc):
+    """Restores compressed text fields in place and returns ``doc``."""
+    for field in COMPRESSED_FIELDS:
+        packed = doc.pop(f"{field}_z", None)
+        if packed is not None:
+            doc[field] = zlib.decompress(bytes(packed)).decode("utf-8")
+    doc.pop("compression", None)
+    return doc
+
+
+def preview_of(doc, field, chars):
+    """Preview for ``field``, falling back to the full text for older documents."""
+    preview = doc.get(PREVIEW_FIELDS[field])
+    if preview is not None:
+        return preview
+    return make_preview(doc.get(field), chars)
@@ -0,0 +1,165 @@
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting prompts.
+
+    Uses UTF-8 byte length rather than character count so Hindi and Tamil
+    text (3 bytes per character, several tokens per word) is not undercounted.
+    """
+    if not text:
+        return 0
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def message_tokens(message):
+    """Token estimate for one chat message, including per-message overhead."""
+    return estimate_tokens(message.get("content", "")) + 4
+
+
+def _clip(text, limit):
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "..."
+
+
+def summarize_messages(messages, snippet_chars=160):
+    """Extractive summary of older turns, one short line per message."""
+    lines = []
+    for msg in messages:
+        role = msg.get("role")
+        if role == "user":
+            lines.append(f"- User asked: {_clip(msg.get('content', ''), snippet_chars)}")
+        elif role == "assistant":
+            lines.append(f"- Assistant answered: {_clip(msg.get('content', ''), snippet_chars)}")
+    return "\n".join(lines)
+
+
+def trim_summary(summary, token_budget):
+    """Drop the oldest summary lines until the summary fits the budget."""
+    if not summary:
+        return ""
+    lines = summary.split("\n")
+    while lines and estimate_tokens("\n".join(lines)) > token_budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationStore:
+    """Server-side conversation history keyed by ``user_id``.
+
+    Each user has one document holding the most recent messages and a rolling
+    summary of older turns. Messages beyond ``max_messages`` are folded into
+    the summary when new turns are appended, so the document stays bounded.
+
+    Updates are atomic in MongoDB rather than read-modify-write, so turns
+    appended concurrently (other threads or gunicorn workers) are never lost.
+    """
+
+    def __init__(self, collection, max_messages=40, summary_token_budget=400, compact_attempts=5):
+        self.collection = collection
+        self.max_messages = max_messages
+        self.summary_token_budget = summary_token_budget
+        self.compact_attempts = compact_attempts
+
+    def load(self, user_id):
+        doc = self.collection.find_one(
+            {"user_id": user_id}, {"messages": 1, "summary": 1}
+        )
+        if not doc:
+            return [], ""
+        return doc.get("messages", []), doc.get("summary", "")
+
+    def append_turn(self, user_id, user_message, assistant_message):
+        """Appends a user/assistant pair and compacts the stored history."""
+        # The push itself is one atomic update; ``version`` counts changes so
+        # compaction can tell whether the document moved underneath it
+        doc = self.collection.find_one_and_update(
+            {"user_id": user_id},
+            {
+                "$push": {"messages": {"$each": [
+                    {"role": "user", "content": user_message},
+                    {"role": "assistant", "content": assistant_message},
+                ]}},
+                "$set": {"updated_at": datetime.now()},
+                "$inc": {"version": 1},
+            },
+            projection={"messages": 1, "summary": 1, "version": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        for _ in range(self.compact_attempts):
+            messages = doc.get("messages", [])
+            if len(messages) <= self.max_messages:
+                return
+            if self._compact(user_id, doc):
+                return
+            doc = self.collection.find_one(
+                {"user_id": user_id}, {"messages": 1, "summary": 1, "version": 1}
+            )
+            if not doc:
+                return
+
+    def _compact(self, user_id, doc):
+        """Folds the overflow of ``doc`` into the summary if it is still current.
+
+        Returns False when another update got there first.
+        """
+        messages = doc["messages"]
+        overflow = messages[: len(messages) - self.max_messages]
+        folded = summarize_messages(overflow)
+        summary = "\n".join(s for s in (doc.get("summary", ""), folded) if s)
+        summary = trim_summary(summary, self.summary_token_budget)
+
+        # $slice drops exactly the folded messages as long as nothing was
+        # pushed since ``doc`` was read, which the version check guarantees
+        result = self.collection.update_one(
+            {"user_id": user_id, "version": doc.get("version")},
+            {
+                "$push": {"messages": {"$each": [], "$slice": -self.max_messages}},
+                "$set": {"summary": summary},
+                "$inc": {"version": 1},
+            },
+        )
+        return result.modified_count == 1
+
+    def clear(self, user_id):
+        self.collection.delete_one({"user_id": user_id})
+
+    def build_context(self, user_id, token_budget, reserved_tokens=0):
+        """Selects the history to send with the next prompt.
+
+        Walks the stored messages from newest to oldest and keeps whole
+        user/assistant pairs while they fit in ``token_budget`` minus
+        ``reserved_tokens`` (system prompt and current user message). Anything
+        older is merged into the rolling summary.
+
+        Returns:
+            tuple: (recent_messages, summary_text)
+        """
+        messages, summary = self.load(user_id)
+        budget = token_budget - reserved_tokens - self.summary_token_budget
+
+        kept = 0
+        used = 0
+        # Step back a pair at a time so an assistant reply is never sent
+        # without the question that produced it.
+        while kept < len(messages):
+            step = 2 if len(messages) - kept >= 2 else 1
+            pair = messages[len(messages) - kept - step: len(messages) - kept]
+            cost = sum(message_tokens(m) for m in pair)
+            if used + cost > budget:
+                break
+            used += cost
+            kept += step
+
+        recent = messages[len(messages) - kept:] if kept else []
+        older = messages[: len(messages) - kept]
+        if older:
+            summary = "\n".join(s for s in (summary, summarize_messages(older)) if s)
+
+        return recent, trim_summary(summary, self.summary_token_budget)
@@ -0,0 +1,267 @@
+"""Enrolled face embeddings for returning-user re-verification.
+
+Each user in auth.py's ``users`` table can have one enrollment row holding a
+compact face embedding (float16, or int8 with a per-vector scale) and the
+version of the model that produced it. A returning user is re-verified by
+embedding only the live selfie and comparing it with the stored vector; the
+ID-card photo is not processed again.
+
+When the verification model changes, stored vectors are stale. Re-embed
+them in bulk from the ID images:
+
+    python enrollment.py reembed --images-dir id_images --model-version vggface2-v2
+"""
+import argparse
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import torch
+
+import auth
+from face_verification import embed_face, match_embeddings
+
+MODEL_VERSION = "VGG-Face2/inception_resnet_v1"
+
+_table_lock = threading.Lock()
+_table_ready = set()
+
+
+def create_enrollments_table(conn=None):
+    """Creates the enrollments table if it doesn't exist."""
+    conn = conn or auth.db.connection()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS enrollments (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            embedding BLOB NOT NULL,
+            dtype TEXT NOT NULL,
+            scale REAL NOT NULL DEFAULT 1.0,
+            dim INTEGER NOT NULL,
+            model_version TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_enrollments_model_version ON enrollments (model_version)")
+    conn.commit()
+
+
+def _connection():
+    conn = auth.db.connection()
+    if auth.db.db_name not in _table_ready:
+        with _table_lock:
+            if auth.db.db_name not in _table_ready:
+                create_enrollments_table(conn)
+                _table_ready.add(auth.db.db_name)
+    return conn
+
+
+def quantize(embedding, dtype="float16"):
+    """Packs an embedding into bytes.
+
+    Returns:
+        tuple: (blob, scale). ``int8`` uses symmetric per-vector scaling.
+    """
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    if dtype == "int8":
+        peak = float(np.abs(vector).max())
+        scale = peak / 127 if peak > 0 else 1.0
+        return np.round(vector / scale).astype(np.int8).tobytes(), scale
+    if dtype == "float16":
+        return vector.astype(np.float16).tobytes(), 1.0
+    raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+
+def dequantize(blob, dtype, scale=1.0):
+    """Unpacks a stored embedding into a float32 vector."""
+    if dtype == "int8":
+        return np.frombuffer(blob, dtype=np.int8).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+
+
+def _as_numpy(embedding):
+    if isinstance(embedding, torch.Tensor):
+        return embedding.detach().cpu().numpy()
+    return np.asarray(embedding)
+
+
+def _row(user_id, embedding, model_version, dtype):
+    vector = _as_numpy(embedding).reshape(-1)
+    blob, scale = quantize(vector, dtype)
+    return (user_id, blob, dtype, scale, vector.size, model_version, datetime.now().isoformat())
+
+
+_UPSERT = """
+    INSERT INTO enrollments (user_id, embedding, dtype, scale, dim, model_version, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        embedding = excluded.embedding,
+        dtype = excluded.dtype,
+        scale = excluded.scale,
+        dim = excluded.dim,
+        model_version = excluded.model_version,
+        updated_at = excluded.updated_at
+"""
+
+
+def get_user_id(username):
+    row = _connection().execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    return row[0] if row else None
+
+
+def save_enrollment(username, embedding, model_version=MODEL_VERSION, dtype="float16"):
+    """Stores (or replaces) a user's embedding. Returns False for unknown users."""
+    user_id = get_user_id(username)
+    if user_id is None:
+        return False
+    with auth.db.transaction() as conn:
+        conn.execute(_UPSERT, _row(user_id, embedding, model_version, dtype))
+    return True
+
+
+def get_enrollment(username):
+    """Returns (embedding as float32 ndarray, model_version), or None."""
+    row = _connection().execute(
+        """
+        SELECT e.embedding, e.dtype, e.scale, e.model_version
+        FROM enrollments e JOIN users u ON u.id = e.user_id
+        WHERE u.username = ?
+        """,
+        (username,),
+    ).fetchone()
+    if row is None:
+        return None
+    blob, dtype, scale, model_version = row
+    return dequantize(blob, dtype, scale), model_version
+
+
+def delete_enrollment(username):
+    user_id = get_user_id(username)
+    if user_id is not None:
+        with auth.db.transaction() as conn:
+            conn.execute("DELETE FROM enrollments WHERE user_id = ?", (user_id,))
+
+
+def enroll(username, id_image, detector_model, verifier_model,
+           model_name="VGG-Face2", model_version=MODEL_VERSION, dtype="float16"):
+    """Embeds the ID-card face once and stores it. Returns False if no face is found."""
+    embedding = embed_face(id_image, detector_model, verifier_model, model_name=model_name)
+    if embedding is None:
+        return False
+    return save_enrollment(username, embedding, model_version, dtype)
+
+
+def reverify(username, live_image, detector_model, verifier_model,
+             model_name="VGG-Face2", model_version=MODEL_VERSION, distance_metric_name="euclidean"):
+    """Re-verifies a returning user against the stored embedding.
+
+    Only the live selfie goes through detection and embedding.
+
+    Returns:
+        bool or None: the verification result, or None when the user has no
+        enrollment for ``model_version`` (run the full ID-photo flow instead).
+    """
+    enrollment = get_enrollment(username)
+    if enrollment is None or enrollment[1] != model_version:
+        return None
+
+    live_embedding = embed_face(live_image, detector_model, verifier_model, model_name=model_name)
+    if live_embedding is None:
+        return False
+
+    stored = torch.from_numpy(enrollment[0]).reshape(1, -1).to(live_embedding.device)
+    verified, _ = match_embeddings(stored, live_embedding, model_name, distance_metric_name)
+    return verified
+
+
+def reembed_users(load_id_image, detector_model, verifier_model, model_version,
+                  model_name="VGG-Face2", dtype="float16", batch_size=64, only_stale=True):
+    """Recomputes stored embeddings after a model change.
+
+    Parameters:
+        load_id_image (callable): username -> RGB ID image, or None if the
+            image is not available.
+        only_stale (bool): Skip users already enrolled with ``model_version``.
+            Users without an enrollment are never included; they enroll
+            through enroll().
+
+    Returns:
+        tuple: (number re-embedded, usernames skipped)
+    """
+    conn = _connection()
+    query = "SELECT u.id, u.username FROM users u JOIN enrollments e ON e.user_id = u.id"
+    params = ()
+    if only_stale:
+        query += " WHERE e.model_version != ?"
+        params = (model_version,)
+    users = conn.execute(query, params).fetchall()
+
+    done = 0
+    skipped = []
+    batch = []
+    for user_id, username in users:
+        image = load_id_image(username)
+        embedding = None
+        if image is not None:
+            embedding = embed_face(image, detector_model, verifier_model, model_name=model_name)
+        if embedding is None:
+            skipped.append(username)
+            continue
+
+        batch.append(_row(user_id, embedding, model_version, dtype))
+        if len(batch) >= batch_size:
+            done += _write_batch(batch)
+            batch = []
+    if batch:
+        done += _write_batch(batch)
+    return done, skipped
+
+
+def _write_batch(rows):
+    with auth.db.transaction() as conn:
+        conn.executemany(_UPSERT, rows)
+    return len(rows)
+
+
+def _image_loader(images_dir):
+    from utils.functions import get_image
+
+    def load(username):
+        for ext in (".jpg", ".jpeg", ".png"):
+            path = os.path.join(images_dir, username + ext)
+            if os.path.exists(path):
+                return get_image(path)
+        return None
+    return load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    reembed = subparsers.add_parser("reembed", help="re-embed enrolled users with the current model")
+    reembed.add_argument("--images-dir", required=True, help="directory of <username>.jpg/.png ID images")
+    reembed.add_argument("--model-version", default=MODEL_VERSION)
+    reembed.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    reembed.add_argument("--batch-size", type=int, default=64)
+    reembed.add_argument("--all", action="store_true", help="also re-embed users already on this version")
+    args = parser.parse_args()
+
+    from facenet.models.mtcnn import MTCNN
+    from verification_models import VGGFace2
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    detector_model = MTCNN(device=device)
+    verifier_model = VGGFace2.load_model(device=device)
+
+    done, skipped = reembed_users(
+        _image_loader(args.images_dir), detector_model, verifier_model,
+        model_version=args.model_version, dtype=args.dtype,
+        batch_size=args.batch_size, only_stale=not args.all,
+    )
+    print(f"Re-embedded {done} users, skipped {len(skipped)}")
+    for username in skipped:
+        print(f"  no usable ID image: {username}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""Asynchronous evidence archive for completed KYC sessions.
+
+Each session becomes one zip bundle under ``root/<YYYY-MM-DD>/<session>.zip``
+holding its frames as JPEG (ID image, verification frame, liveness frames)
+and a ``metadata.json`` with verdicts, distances and timings.
+
+Nothing here runs on the caller's thread beyond a queue put:
+
+- ``add_frame`` passes the array by reference through a bounded queue; when
+  the queue is full the frame is dropped and counted instead of blocking.
+- A thread pool JPEG-encodes frames (cv.imencode releases the GIL).
+- One writer thread assembles closed sessions into bundles, writing each to
+  a temporary file, fsyncing it and renaming it into place. Bundles that
+  finish together share one directory fsync.
+- Bundles older than ``retention_days`` are deleted at start-up and then
+  every ``cleanup_interval`` seconds.
+
+Frames are encoded after ``add_frame`` returns, so a buffer the caller reuses
+(e.g. FramePreprocessor's) must be passed with ``copy=True``.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2 as cv
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EvidenceSession:
+    """Collects one KYC session's frames and verdicts. Thread-safe."""
+
+    def __init__(self, archiver, session_id, metadata):
+        self.archiver = archiver
+        self.session_id = session_id
+        self.started_at = datetime.now()
+        self.metadata = {
+            "session_id": session_id,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            **metadata,
+        }
+        self.verdicts = []
+        self.frames = []
+        self.dropped_frames = 0
+        self.closed = False
+        self._sequence = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._encoded = threading.Condition(self._lock)
+
+    def add_frame(self, kind, image, color="rgb", copy=False, **info):
+        """Queues a frame for encoding. Returns False if it was dropped."""
+        if image is None:
+            return False
+        with self._lock:
+            if self.closed:
+                raise RuntimeError(f"Evidence session {self.session_id} is closed")
+            self._sequence += 1
+            sequence = self._sequence
+            self._pending += 1
+        if copy:
+            image = np.array(image, copy=True)
+        item = (self, sequence, kind, image, color, info, time.time())
+        if not self.archiver._enqueue(item):
+            with self._lock:
+                self._pending -= 1
+                self.dropped_frames += 1
+                self._encoded.notify_all()
+            return False
+        return True
+
+    def add_verdict(self, stage, passed, **details):
+        """Records a decision, e.g. distance and timing of face matching."""
+        with self._lock:
+            self.verdicts.append({
+                "stage": stage,
+                "passed": passed,
+                "at": datetime.now().isoformat(timespec="milliseconds"),
+                **details,
+            })
+
+    def close(self, outcome=None, **metadata):
+        """Marks the session complete; the bundle is written in the background."""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.metadata.update(metadata)
+            self.metadata["outcome"] = outcome
+            self.metadata["finished_at"] = datetime.now().isoformat(timespec="milliseconds")
+        self.archiver._finalize(self)
+
+    def _frame_done(self, record):
+        with self._lock:
+            if record is not None:
+                self.frames.append(record)
+            else:
+                self.dropped_frames += 1
+            self._pending -= 1
+            self._encoded.notify_all()
+
+    def _wait_encoded(self, timeout):
+        with self._lock:
+            return self._encoded.wait_for(lambda: self._pending == 0, timeout)
+
+
+class EvidenceArchiver:
+    """Writes per-session evidence bundles off the calling thread.
+
+    Parameters:
+        root (str): Directory the dated bundle folders go in.
+        encode_workers (int): JPEG encoder threads.
+        max_queue (int): Frames waiting for an encoder before new ones drop.
+        jpeg_quality (int): cv.IMWRITE_JPEG_QUALITY for stored frames.
+        retention_days (float): Bundles older than this are deleted; None keeps all.
+        batch_window (float): How long the writer waits to batch closed sessions.
+    """
+
+    def __init__(self, root="evidence", encode_workers=2, max_queue=64, jpeg_quality=85,
+                 retention_days=None, cleanup_interval=3600.0, batch_window=0.2):
+        self.root = root
+        self.max_queue = max_queue
+        self.jpeg_quality = jpeg_quality
+        self.retention_days = retention_days
+        self.cleanup_interval = cleanup_interval
+        self.batch_window = batch_window
+        os.makedirs(root, exist_ok=True)
+
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._encoders = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="evidence-encode")
+        self._closed_sessions = queue.Queue()
+        self._stopping = False
+        self._next_cleanup = 0.0
+        self.dropped_frames = 0
+        self.bundles_written = 0
+
+        self._writer = threading.Thread(target=self._run_writer, name="evidence-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def begin_session(self, session_id=None, **metadata):
+        session_id = session_id or f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        return EvidenceSession(self, session_id, metadata)
+
+    # Encoding
+
+    def _enqueue(self, item):
+        if self._stopping or not self._slots.acquire(blocking=False):
+            self.dropped_frames += 1
+            logger.warning(f"Evidence queue full, dropped {item[2]} frame of session {item[0].session_id}")
+            return False
+        self._encoders.submit(self._encode, item)
+        return True
+
+    def _encode(self, item):
+        session, sequence, kind, image, color, info, captured_at = item
+        record = None
+        try:
+            if color == "rgb" and image.ndim == 3:
+                image = cv.cvtColor(image, cv.COLOR_RGB2BGR)
+            ok, encoded = cv.imencode(".jpg", image, [cv.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                record = {
+                    "name": f"frames/{sequence:04d}_{kind}.jpg",
+                    "kind": kind,
+                    "captured_at": datetime.fromtimestamp(captured_at).isoformat(timespec="milliseconds"),
+                    "width": int(image.shape[1]),
+                    "height": int(image.shape[0]),
+                    "data": encoded.tobytes(),
+                    **info,
+                }
+            else:
+                logger.error(f"Failed to encode {kind} frame of session {session.session_id}")
+        except Exception as e:
+            logger.error(f"Failed to encode {kind} frame of session {session.session_id}: {e}")
+        finally:
+            self._slots.release()
+            session._frame_done(record)
+
+    # Writing
+
+    def _finalize(self, session):
+        self._closed_sessions.put(session)
+
+    def _run_writer(self):
+        while True:
+            self._maybe_cleanup()
+            try:
+                session = self._closed_sessions.get(timeout=min(self.cleanup_interval, 60.0))
+            except queue.Empty:
+                continue
+            if session is None:
+                return
+
+            # Collect sessions that close close together into one batch
+            batch = [session]
+            deadline = time.monotonic() + self.batch_window
+            stop = False
+            while True:
+                try:
+                    session = self._closed_sessions.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if session is None:
+                    stop = True
+                    break
+                batch.append(session)
+
+            self._write_batch(batch)
+            if stop:
+                return
+
+    def _write_batch(self, sessions):
+        directories = set()
+        for session in sessions:
+            if not session._wait_encoded(timeout=30.0):
+                logger.warning(f"Writing session {session.session_id} before all frames were encoded")
+            # Any failure loses this bundle only; the writer thread must
+            # survive to write the sessions queued behind it
+            try:
+                directories.add(self._write_bundle(session))
+                self.bundles_written += 1
+            except Exception:
+                logger.exception(f"Failed to write evidence bundle {session.session_id}")
+        # One directory fsync per folder makes the renames durable
+        for directory in directories:
+            try:
+                _fsync_directory(directory)
+            except Exception:
+                logger.exception(f"Failed to fsync evidence directory {directory}")
+
+    def _write_bundle(self, session):
+        with session._lock:
+            frames = sorted(session.frames, key=lambda f: f["name"])
+            metadata = dict(session.metadata)
+            metadata["verdicts"] = list(session.verdicts)
+            metadata["dropped_frames"] = session.dropped_frames
+            session.frames = []
+
+        metadata["frames"] = [{k: v for k, v in f.items() if k != "data"} for f in frames]
+        directory = os.path.join(self.root, session.started_at.strftime("%Y-%m-%d"))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{session.session_id}.zip")
+        tmp_path = f"{path}.tmp"
+
+        # JPEG is already compressed; only the metadata is deflated
+        with open(tmp_path, "wb") as raw:
+            with zipfile.ZipFile(raw, "w", compression=zipfile.ZIP_STORED) as bundle:
+                for frame in frames:
+                    bundle.writestr(frame["name"], frame["data"])
+                bundle.writestr(
+                    "metadata.json",
+                    json.dumps(metadata, ensure_ascii=False, indent=2, default=str),
+                    compress_type=zipfile.ZIP_DEFLATED,
+                )
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+        logger.info(f"Archived evidence session {session.session_id} ({len(frames)} frames)")
+        return directory
+
+    # Retention
+
+    def _maybe_cleanup(self):
+        if self.retention_days is None or time.monotonic() < self._next_cleanup:
+            return
+        self._next_cleanup = time.monotonic() + self.cleanup_interval
+        try:
+            removed = self.cleanup()
+            if removed:
+                logger.info(f"Removed {removed} expired evidence bundles")
+        except OSError as e:
+            logger.error(f"Evidence retention cleanup failed: {e}")
+
+    def cleanup(self, now=None):
+        """Deletes bundles past the retention period. Returns how many were removed."""
+        if self.retention_days is None:
+            return 0
+        cutoff = (now or datetime.now()) - timedelta(days=self.retention_days)
+        removed = 0
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            try:
+                day = datetime.strptime(name, "%Y-%m-%d")
+            except ValueError:
+                continue
+            if not os.path.isdir(directory):
+                continue
+            # Whole days past the cutoff go at once, the boundary day per file
+            if day + timedelta(days=1) <= cutoff:
+                removed += sum(1 for f in os.listdir(directory) if f.endswith(".zip"))
+                shutil.rmtree(directory)
+                continue
+            for filename in os.listdir(directory):
+                path = os.path.join(directory, filename)
+                if filename.endswith(".zip") and datetime.fromtimestamp(os.path.getmtime(path)) < cutoff:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    def close(self, timeout=30.0):
+        """Finishes pending encodes and bundles; called automatically at exit."""
+        if self._stopping:
+            return
+        self._stopping = True
+        self._closed_sessions.put(None)
+        self._writer.join(timeout)
+        self._encoders.shutdown(wait=True)
+
+
+def _fsync_directory(directory):
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -2,37 +2,34 @@ import cv2 as cv
 import torch
 from PIL import Image
 from facenet.models.mtcnn import MTCNN
+from profiling import span
 from utils.distance import *
 from utils.functions import *
 from verification_models import VGGFace2
+from verification_backends import backend_for_model_name, distance_metric, select_backend
 
 def face_matching(
     face1, face2, model: torch.nn.Module, distance_metric_name, model_name, device="cpu"
 ):
-    assert model_name == "VGG-Face2", f"{model_name} is not supported"
-    
-    distance_metric = {
-        "cosine": Cosine_Distance,
-        "L1": L1_Distance,
-        "euclidean": Euclidean_Distance,
-    }
+    backend = backend_for_model_name(model_name)
     
     distance_func = distance_metric.get(distance_metric_name, Euclidean_Distance)
     
     # Use device from model's parameters instead of calling device()
     device = next(model.parameters()).device
     
-    face1 = face_transform(face1, model_name=model_name, device=device)
-    face2 = face_transform(face2, model_name=model_name, device=device)
+    with span("face_transform"):
+        face1 = backend.preprocess(face1, device=device)
+        face2 = backend.preprocess(face2, device=device)
     
-    result1 = model(face1)
-    result2 = model(face2)
+    with span("embedding", model=model_name):
+        result1 = model(face1)
+        result2 = model(face2)
     
-    dis = distance_func(result1, result2)
+    with span("distance"):
+        dis = distance_func(result1, result2)
     
-    threshold = findThreshold(
-        model_name=model_name, distance_metric=distance_metric_name
-    )
+    threshold = backend.threshold(distance_metric_name)
     return dis < threshold
 
 def verify(
@@ -41,9 +38,21 @@ def verify(
     detector_model: MTCNN,
     verifier_model,
     model_name="VGG-Face2",
+    mode=None,
 ):
-    face1, box1, landmarks = extract_face(img1, detector_model, padding=1)
-    face2, box2, landmarks = extract_face(img2, detector_model, padding=1)
+    """Checks whether two RGB images show the same person.
+
+    With ``mode`` ("fast", "accurate" or "cascade") the backend is chosen
+    from the registry instead of ``model_name``; see verify_with_mode().
+    """
+    if mode is not None:
+        return verify_with_mode(
+            img1, img2, detector_model, mode, verifier_model, model_name
+        )["verified"]
+    
+    with span("extract_face"):
+        face1, box1, landmarks = extract_face(img1, detector_model, padding=1)
+        face2, box2, landmarks = extract_face(img2, detector_model, padding=1)
     
     verified = face_matching(
         face1,
@@ -55,6 +64,89 @@ def verify(
     
     return verified
 
+@torch.no_grad()
+def verify_with_mode(
+    img1: np.ndarray,
+    img2: np.ndarray,
+    detector_model: MTCNN,
+    mode="cascade",
+    verifier_model=None,
+    model_name="VGG-Face2",
+    distance_metric_name="euclidean",
+    margin=0.1,
+):
+    """Verifies with a registry backend picked by speed/accuracy profile.
+
+    ``mode=None`` uses the ``model_name`` backend, as verify() does.
+    "cascade" screens with the fast backend and only runs the accurate one
+    when the fast distance is within ``margin`` (a fraction of the threshold)
+    of the decision boundary. ``verifier_model``, if given, is the already
+    loaded ``model_name`` model; its backend reuses it instead of loading a
+    second copy, and other backends load on the same device.
+
+    Returns:
+        dict: verified, backend, distance, threshold, escalated
+    """
+    with span("extract_face"):
+        face1, box1, _ = extract_face(img1, detector_model, padding=1)
+        face2, box2, _ = extract_face(img2, detector_model, padding=1)
+    if box1 is None or box2 is None:
+        return {"verified": False, "backend": None, "distance": None, "threshold": None, "escalated": False}
+    
+    device = "cpu"
+    if verifier_model is not None:
+        device = next(verifier_model.parameters()).device
+        backend_for_model_name(model_name).adopt(verifier_model)
+    
+    def run(backend):
+        model = backend.load(device)
+        model_device = next(model.parameters()).device
+        with span("face_transform"):
+            input1 = backend.preprocess(face1, device=model_device)
+            input2 = backend.preprocess(face2, device=model_device)
+        with span("embedding", model=backend.model_name):
+            embedding1 = model(input1)
+            embedding2 = model(input2)
+        verified, dis, threshold = backend.compare(embedding1, embedding2, distance_metric_name)
+        return {"verified": bool(verified), "backend": backend.name, "distance": dis,
+                "threshold": threshold, "escalated": False}
+    
+    if mode is None:
+        return run(backend_for_model_name(model_name))
+    if mode != "cascade":
+        return run(select_backend(mode))
+    
+    fast, accurate = select_backend("fast"), select_backend("accurate")
+    result = run(fast)
+    if accurate is not fast and abs(result["distance"] - result["threshold"]) <= margin * result["threshold"]:
+        result = run(accurate)
+        result["escalated"] = True
+    return result
+
+@torch.no_grad()
+def embed_face(
+    img: np.ndarray, detector_model: MTCNN, verifier_model, model_name="VGG-Face2", padding=1
+):
+    """Detects the face in an RGB image and returns its embedding, or None."""
+    with span("extract_face"):
+        face, box, landmarks = extract_face(img, detector_model, padding=padding)
+    if box is None:
+        return None
+    
+    device = next(verifier_model.parameters()).device
+    with span("face_transform"):
+        face = face_transform(face, model_name=model_name, device=device)
+    with span("embedding", model=model_name):
+        return verifier_model(face)
+
+def match_embeddings(embedding1, embedding2, model_name="VGG-Face2", distance_metric_name="euclidean"):
+    """Compares two embeddings; returns (verified, distance)."""
+    distance_func = distance_metric.get(distance_metric_name, Euclidean_Distance)
+    dis = distance_func(embedding1, embedding2)
+    
+    threshold = backend_for_model_name(model_name).threshold(distance_metric_name)
+    return bool(dis < threshold), float(dis)
+
 if __name__ == "__main__":
     filename1 = "images/thanh2.png"
     filename2 = "images/thanh4.jpg"
@@ -0,0 +1,172 @@
+"""Local stand-ins for Groq, gTTS and MongoDB used by load_test.py.
+
+- FakeGroqServer: OpenAI-compatible ``/chat/completions`` endpoint with a
+  configurable time to first token, generation rate and error rate.
+- FakeTTS: drop-in for ``gtts.gTTS`` that sleeps instead of calling Google.
+- boot_chat_app(): starts chat.py in-process against these fakes, with
+  mongomock in place of MongoDB unless a real ``mongo_uri`` is given.
+
+The Groq stand-in can also run on its own, for a chat.py started separately
+with GROQ_API_URL pointing at it:
+
+    python fake_services.py --port 8001 --latency 0.3 --tokens-per-second 250
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOREM = (
+    "KYC requires verifying a customer's identity with an official photo ID and "
+    "proof of address before the account is opened. "
+).split()
+
+
+class FakeGroqServer:
+    """OpenAI-compatible chat completion server with synthetic latency.
+
+    A response of ``completion_tokens`` tokens takes
+    ``latency + completion_tokens / tokens_per_second`` seconds.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.3, tokens_per_second=250.0,
+                 completion_tokens=200, error_rate=0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/openai/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-groq", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests += 1
+
+                if random.random() < server.error_rate:
+                    self._send(503, {"error": {"message": "fake upstream overloaded"}})
+                    return
+
+                tokens = min(server.completion_tokens, body.get("max_tokens", server.completion_tokens))
+                time.sleep(server.latency + tokens / server.tokens_per_second)
+                content = " ".join(LOREM[i % len(LOREM)] for i in range(tokens))
+                prompt_tokens = sum(len(m.get("content", "")) // 4 for m in body.get("messages", []))
+                self._send(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": tokens,
+                        "total_tokens": prompt_tokens + tokens,
+                    },
+                })
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+class FakeTTS:
+    """Replacement for gtts.gTTS: waits ``latency`` seconds and writes a stub file."""
+
+    latency = 0.2
+
+    def __init__(self, text, lang="en", slow=False, **kwargs):
+        self.text = text
+        self.lang = lang
+
+    def save(self, path):
+        time.sleep(self.latency)
+        with open(path, "wb") as f:
+            f.write(b"ID3")
+
+
+def boot_chat_app(groq_url, tts_latency=0.2, mongo_uri=None, host="127.0.0.1", port=0):
+    """Starts chat.py on a threaded WSGI server against local fakes.
+
+    Must run before anything else imports chat. Returns (base_url, server).
+    """
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    os.environ["GROQ_API_URL"] = groq_url
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+    else:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    import chat
+    from werkzeug.serving import make_server
+
+    FakeTTS.latency = tts_latency
+    chat.gTTS = FakeTTS
+    os.makedirs("static/audio", exist_ok=True)
+
+    server = make_server(host, port, chat.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="chat-app", daemon=True).start()
+    return f"http://{host}:{server.server_port}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=250.0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeGroqServer(args.host, args.port, args.latency, args.tokens_per_second,
+                            args.completion_tokens, args.error_rate)
+    print(f"Fake Groq API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+from collections import Counter
+
+import cv2 as cv
+import numpy as np
+
+
+class AllocationCounter:
+    """Counts buffer allocations made by the preprocessing path, per site.
+
+    In steady state (same camera resolution) a frame should not add to the
+    count; any increase means a buffer was reallocated.
+    """
+
+    def __init__(self):
+        self.by_site = Counter()
+
+    @property
+    def allocations(self):
+        return sum(self.by_site.values())
+
+    def record(self, site):
+        self.by_site[site] += 1
+
+    def reset(self):
+        self.by_site.clear()
+
+
+allocation_counter = AllocationCounter()
+
+
+class FramePreprocessor:
+    """Camera frame path that reuses preallocated buffers.
+
+    Per frame: the capture writes into a persistent BGR buffer, the mirror
+    flip is done in place and color conversion writes into a persistent RGB
+    buffer.
+    """
+
+    def __init__(self, mirror=True, counter=allocation_counter):
+        self.mirror = mirror
+        self.counter = counter
+        self._buffers = {}
+
+    def _buffer(self, name, shape, dtype):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+            self.counter.record(name)
+        return buffer
+
+    def read(self, capture):
+        """Reads a frame into the persistent buffers.
+
+        Returns:
+            tuple: (ok, bgr, rgb). ``bgr`` is the mirrored camera frame for
+            display and ``rgb`` the detector input; both are reused on the
+            next call.
+        """
+        bgr = self._buffers.get("bgr")
+        ok, frame = capture.read(bgr) if bgr is not None else capture.read()
+        if not ok:
+            return False, None, None
+        if frame is not bgr:
+            # First frame or resolution change. The capture may hand out an
+            # array it still owns (CameraService shares its latest frame
+            # between pages), and prepare() flips in place, so adopt a copy
+            frame = frame.copy()
+            self._buffers["bgr"] = frame
+            self.counter.record("bgr")
+        return (True,) + self.prepare(frame)
+
+    def prepare(self, bgr):
+        """Mirrors ``bgr`` in place and converts it into the RGB buffer."""
+        if self.mirror:
+            cv.flip(bgr, 1, dst=bgr)
+        rgb = self._buffer("rgb", bgr.shape, bgr.dtype)
+        cv.cvtColor(bgr, cv.COLOR_BGR2RGB, dst=rgb)
+        return bgr, rgb
@@ -0,0 +1,25 @@
+# Gunicorn configuration for chat.py (see wsgi.py).
+#
+# One gevent worker per core; each worker multiplexes up to
+# `worker_connections` in-flight chats cooperatively. Most of a /chat
+# request is spent waiting on Groq and gTTS, so concurrency per process is
+# bounded by connections, not by threads.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 200))
+
+# Must outlast the Groq timeout plus text-to-speech
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 90))
+graceful_timeout = 30
+keepalive = 5
+
+# Every worker rotates its own log file; a shared app.log would be rotated
+# by several processes at once. Workers inherit this and expand {pid}.
+os.environ.setdefault("LOG_FILE", "app.{pid}.log")
+
+accesslog = "-"
+errorlog = "-"
@@ -0,0 +1,243 @@
+"""Adaptive analysis rate for live camera loops.
+
+The preview should run at a steady frame rate, but MTCNN and the liveness
+models cost far more than one frame period on slow machines. An
+``InferenceGovernor`` decides per frame whether to run analysis. It measures
+the preview cost, the inference cost and the process CPU use, and picks the
+longest analysis interval that still
+
+- keeps analysis under ``inference_share`` of wall time and leaves enough
+  of each second for the preview to hold ``target_fps``,
+- keeps CPU use under ``cpu_target`` (a share of all cores), and
+- never exceeds ``max_decision_latency`` between analyses.
+
+The preview keeps running on skipped frames and shows the last result.
+
+Where analysis runs matters. Run inline on the preview thread (the first
+example), every analysis freezes the preview for the whole inference, so
+the frame rate from stats() is an average that hides those stutters. Only
+analysis on a worker thread (the second example, or challenge_response.py)
+keeps the preview smooth.
+
+OpenCV loop, inline::
+
+    governor = InferenceGovernor(target_fps=30)
+    while True:
+        with governor.frame():
+            ok, frame, rgb = preprocessor.read(video)
+            if governor.should_analyze():
+                with governor.analysis():
+                    result = analyze(rgb)
+            cv.imshow("", frame)
+
+Qt page, with inference on a TaskRunner so the GUI thread only previews::
+
+    self.timer.setInterval(governor.preview_interval_ms())
+    ...
+    def update_frame(self):
+        with self.governor.frame():
+            ...show frame...
+        if not self.governor.busy and self.governor.should_analyze():
+            self.governor.start_analysis()
+            self.tasks.submit(analyze, rgb, on_result=self.on_result)
+    def on_result(self, result):
+        self.governor.finish_analysis()
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _Ewma:
+    __slots__ = ("alpha", "value")
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, sample):
+        if self.value is None:
+            self.value = sample
+        else:
+            self.value += self.alpha * (sample - self.value)
+        return self.value
+
+
+class InferenceGovernor:
+    """Chooses how often to run inference so the preview keeps its frame rate.
+
+    Parameters:
+        target_fps (float): Preview frame rate to hold.
+        max_decision_latency (float): Longest allowed gap between analyses
+            (seconds). Wins over ``target_fps`` when both cannot be met.
+        inference_share (float): Largest share of wall time analysis may
+            take. Inline analysis blocks the preview, so the preview keeps
+            roughly ``1 - inference_share`` of ``target_fps`` on average,
+            with a stall of one inference each time analysis runs.
+        cpu_target (float): Process CPU use, as a share of all cores, above
+            which the analysis rate backs off.
+        smoothing (float): EWMA weight of new cost samples.
+        clock, cpu_clock (callable): Time sources; injectable for replay.
+    """
+
+    def __init__(self, target_fps=30.0, max_decision_latency=0.5, inference_share=0.25, cpu_target=0.75,
+                 smoothing=0.2, cpu_window=1.0, clock=time.perf_counter,
+                 cpu_clock=time.process_time, cpu_count=None):
+        self.target_fps = target_fps
+        self.max_decision_latency = max_decision_latency
+        self.inference_share = inference_share
+        self.cpu_target = cpu_target
+        self.cpu_window = cpu_window
+        self.clock = clock
+        self.cpu_clock = cpu_clock
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+
+        self._frame_cost = _Ewma(smoothing)
+        self._inference_cost = _Ewma(smoothing)
+        self._frame_period = _Ewma(smoothing)
+        self._lock = threading.Lock()
+
+        self.min_interval = 1.0 / target_fps
+        self.interval = self.min_interval
+        self.cpu_utilization = 0.0
+        self._cpu_scale = 1.0
+        self._analysis_in_frame = 0.0
+        self._preview_thread = None
+        self.busy = False
+        self.frames = 0
+        self.analyses = 0
+        self._last_analysis = None
+        self._last_frame = None
+        self._analysis_start = None
+        self._analysis_inline = False
+        self._cpu_mark = (self.clock(), self.cpu_clock())
+
+    def preview_interval_ms(self):
+        """QTimer interval for the preview."""
+        return max(int(1000 / self.target_fps), 1)
+
+    # Preview frames
+
+    @contextmanager
+    def frame(self):
+        """Times one preview frame (capture, drawing, display)."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record_frame(start, self.clock())
+
+    def record_frame(self, start, end):
+        """Records a preview frame; the calling thread is the preview thread."""
+        with self._lock:
+            self._preview_thread = threading.get_ident()
+            self.frames += 1
+            # Inline analysis on the preview thread is not preview cost
+            self._frame_cost.update(max(end - start - self._analysis_in_frame, 0.0))
+            self._analysis_in_frame = 0.0
+            if self._last_frame is not None:
+                self._frame_period.update(start - self._last_frame)
+            self._last_frame = start
+            self._sample_cpu(end)
+
+    # Analysis
+
+    def should_analyze(self, max_interval=None):
+        """True when this frame should be analyzed.
+
+        ``max_interval`` tightens the decision latency for one call, e.g. a
+        blink challenge that must sample the eyes more often.
+        """
+        with self._lock:
+            if self.busy:
+                return False
+            now = self.clock()
+            if self._last_analysis is None:
+                return True
+            interval = self.interval
+            if max_interval is not None:
+                interval = min(interval, max_interval)
+            return now - self._last_analysis >= interval
+
+    @contextmanager
+    def analysis(self):
+        """Times an analysis run inline on the calling thread."""
+        self.start_analysis(inline=True)
+        try:
+            yield
+        finally:
+            self.finish_analysis()
+
+    def start_analysis(self, inline=False):
+        """Marks the start of an analysis.
+
+        ``inline`` means it runs on the preview thread within the current
+        frame; only then is its time taken out of the frame cost. Analyses
+        handed to a worker and finished from a result callback on the
+        preview thread did not block the frame.
+        """
+        with self._lock:
+            self.busy = True
+            self._analysis_start = self.clock()
+            self._analysis_inline = inline
+            self._last_analysis = self._analysis_start
+
+    def finish_analysis(self):
+        with self._lock:
+            end = self.clock()
+            if self._analysis_start is not None:
+                duration = end - self._analysis_start
+                self._inference_cost.update(duration)
+                if self._analysis_inline and self._preview_thread == threading.get_ident():
+                    self._analysis_in_frame += duration
+            self._analysis_start = None
+            self._analysis_inline = False
+            self.busy = False
+            self.analyses += 1
+            self._sample_cpu(end)
+            self._adjust()
+
+    # Control
+
+    def _sample_cpu(self, now):
+        mark_wall, mark_cpu = self._cpu_mark
+        elapsed = now - mark_wall
+        if elapsed < self.cpu_window:
+            return
+        cpu = self.cpu_clock()
+        self.cpu_utilization = (cpu - mark_cpu) / (elapsed * self.cpu_count)
+        self._cpu_mark = (now, cpu)
+
+        # Multiplicative back-off while over the CPU target, gradual recovery
+        if self.cpu_utilization > self.cpu_target:
+            self._cpu_scale = min(self._cpu_scale * self.cpu_utilization / self.cpu_target, 16.0)
+        elif self.cpu_utilization < 0.9 * self.cpu_target:
+            self._cpu_scale = max(self._cpu_scale * 0.8, 1.0)
+
+    def _adjust(self):
+        inference = self._inference_cost.value
+        if not inference:
+            return
+
+        # Seconds per second the preview needs at the target rate; inference
+        # may use its share of what is left
+        preview_load = (self._frame_cost.value or 0.0) * self.target_fps
+        headroom = max(min(self.inference_share, 1.0 - preview_load), 0.05)
+        interval = inference / headroom * self._cpu_scale
+        self.interval = min(max(interval, self.min_interval), self.max_decision_latency)
+
+    def stats(self):
+        with self._lock:
+            period = self._frame_period.value
+            inference = self._inference_cost.value
+            return {
+                "preview_fps": 1.0 / period if period else 0.0,
+                "analysis_fps": 1.0 / self.interval,
+                "analysis_interval_ms": self.interval * 1000,
+                "inference_ms": inference * 1000 if inference else 0.0,
+                "frame_ms": (self._frame_cost.value or 0.0) * 1000,
+                "cpu_utilization": self.cpu_utilization,
+                "frames": self.frames,
+                "analyses": self.analyses,
+            }
@@ -0,0 +1,167 @@
+"""Load test for the chat server.
+
+Ramps the number of concurrent virtual users and reports, for each level and
+endpoint, throughput, p50/p95/p99 latency and error rate. Each virtual user
+keeps its own session cookie and repeats: POST /chat, GET /history,
+POST /feedback on the chat it just created. The last level where /chat
+throughput still scales with concurrency is how many in-flight chats the
+server handles.
+
+Against a running instance:
+
+    gunicorn -c gunicorn.conf.py -w 1 wsgi:app
+    python load_test.py --url http://localhost:5000 --levels 1,8,32,128
+
+Self-contained, with chat.py booted in-process against a fake Groq API, a
+fake TTS and mongomock (or --mongo-uri for a local mongod):
+
+    python load_test.py --with-fakes --groq-latency 0.5 --tokens-per-second 200
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ENDPOINTS = ("chat", "history", "feedback")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_user(url, iterations, endpoints, message, language, timeout):
+    """One virtual user: its own cookie jar, sequential requests.
+
+    Returns {endpoint: [(latency, ok), ...]}.
+    """
+    session = requests.Session()
+    results = defaultdict(list)
+
+    def call(name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, f"{url}{path}", timeout=timeout, **kwargs)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            response, ok = None, False
+        results[name].append((time.perf_counter() - start, ok))
+        return response if ok else None
+
+    # /chat assigns the session's user_id, so no warm-up request is needed
+    for _ in range(iterations):
+        chat_id = None
+        if "chat" in endpoints:
+            response = call("chat", "POST", "/chat", json={"message": message, "language": language})
+            if response is not None:
+                chat_id = response.json().get("chat_id")
+        if "history" in endpoints:
+            call("history", "GET", "/history", params={"limit": 10})
+        if "feedback" in endpoints and chat_id:
+            call("feedback", "POST", "/feedback", json={"chat_id": chat_id, "rating": 5})
+    return results
+
+
+def run_level(url, concurrency, iterations, endpoints, message, language, timeout):
+    # Release every user at once so the level really has `concurrency`
+    # requests in flight
+    barrier = threading.Barrier(concurrency)
+
+    def user(_):
+        barrier.wait()
+        return run_user(url, iterations, endpoints, message, language, timeout)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        per_user = list(pool.map(user, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    merged = defaultdict(list)
+    for results in per_user:
+        for name, samples in results.items():
+            merged[name].extend(samples)
+
+    report = {}
+    for name, samples in merged.items():
+        latencies = [latency for latency, _ in samples]
+        errors = sum(1 for _, ok in samples if not ok)
+        report[name] = {
+            "requests": len(samples),
+            "throughput": len(samples) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "error_rate": errors / len(samples) if samples else 0.0,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--levels", default="1,4,16,64", help="comma-separated concurrency levels")
+    parser.add_argument("--iterations", type=int, default=3, help="request cycles per virtual user")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="subset of chat,history,feedback")
+    parser.add_argument("--message", default="What documents are required for KYC?")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--scaling-efficiency", type=float, default=0.7,
+                        help="minimum fraction of ideal linear /chat throughput to count as scaling")
+
+    fakes = parser.add_argument_group("local fakes")
+    fakes.add_argument("--with-fakes", action="store_true",
+                       help="boot chat.py in-process against fake Groq/TTS and mongomock")
+    fakes.add_argument("--groq-latency", type=float, default=0.3, help="fake time to first token (s)")
+    fakes.add_argument("--tokens-per-second", type=float, default=250.0)
+    fakes.add_argument("--completion-tokens", type=int, default=200)
+    fakes.add_argument("--groq-error-rate", type=float, default=0.0)
+    fakes.add_argument("--tts-latency", type=float, default=0.2)
+    fakes.add_argument("--mongo-uri", default=None, help="use this mongod instead of mongomock")
+    args = parser.parse_args()
+
+    url = args.url
+    if args.with_fakes:
+        from fake_services import FakeGroqServer, boot_chat_app
+
+        groq = FakeGroqServer(latency=args.groq_latency, tokens_per_second=args.tokens_per_second,
+                              completion_tokens=args.completion_tokens,
+                              error_rate=args.groq_error_rate).start()
+        url, _ = boot_chat_app(groq.url, tts_latency=args.tts_latency, mongo_uri=args.mongo_uri)
+        print(f"chat.py on {url}, fake Groq on {groq.url}\n")
+
+    endpoints = [name for name in args.endpoints.split(",") if name]
+    levels = [int(level) for level in args.levels.split(",")]
+    print(f"{'users':>6} {'endpoint':<9} {'reqs':>6} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'errors':>7}")
+
+    baseline = None
+    max_in_flight = 0
+    for concurrency in levels:
+        report = run_level(url, concurrency, args.iterations, endpoints,
+                           args.message, args.language, args.timeout)
+        for name in ENDPOINTS:
+            if name not in report:
+                continue
+            r = report[name]
+            print(f"{concurrency:>6} {name:<9} {r['requests']:>6} {r['throughput']:>8.2f} "
+                  f"{r['p50']:>8.3f} {r['p95']:>8.3f} {r['p99']:>8.3f} {r['error_rate']:>7.1%}")
+
+        chat = report.get("chat")
+        if chat:
+            per_user = chat["throughput"] / concurrency
+            if baseline is None:
+                baseline = per_user
+            if chat["error_rate"] < 0.01 and per_user >= baseline * args.scaling_efficiency:
+                max_in_flight = concurrency
+
+    if "chat" in endpoints:
+        print(f"\nConcurrent in-flight chats handled without saturating: {max_in_flight}")
+
+
+if __name__ == "__main__":
+    main()
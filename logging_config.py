@@ -0,0 +1,111 @@
+"""Queue-based JSON logging for chat.py.
+
+Request threads only put records on an in-memory queue (``QueueHandler``); a
+``QueueListener`` thread does the formatting and the file and console I/O.
+The log file is written as JSON lines and rotated by size or time:
+
+    {"ts": "...", "level": "INFO", "logger": "chat", "message": "...",
+     "request_id": "...", "stage": "groq", "duration_ms": 512.3, ...}
+
+Each gunicorn worker owns its listener and rotates its own file, so workers
+must not share one. gunicorn.conf.py defaults LOG_FILE to ``app.{pid}.log``
+(``{pid}`` is replaced with the worker's process id); an empty LOG_FILE logs
+to the console stream only.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# Attributes passed through ``extra=`` that are copied into the JSON line
+EXTRA_FIELDS = (
+    "stage", "duration_ms", "model", "language", "method", "path", "status",
+    "user_id", "collection", "count",
+)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the id of the request being served."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for field in EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(log_file="app.log", level=logging.INFO, rotation="size",
+                      max_bytes=10 * 1024 * 1024, backup_count=5, when="midnight"):
+    """Installs the queue handler on the root logger and starts the listener.
+
+    Parameters:
+        log_file (str): JSON-lines log file; ``{pid}`` is replaced with the
+            process id. Empty or None disables the file.
+        rotation (str): 'size' for RotatingFileHandler, 'time' for
+            TimedRotatingFileHandler.
+        max_bytes (int): Size threshold for size-based rotation.
+        backup_count (int): Rotated files to keep.
+        when (str): Interval for time-based rotation (see TimedRotatingFileHandler).
+
+    Returns:
+        QueueListener: The running listener; it is stopped at exit.
+    """
+    handlers = []
+    if log_file:
+        log_file = log_file.replace("{pid}", str(os.getpid()))
+        if rotation == "time":
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                log_file, when=when, backupCount=backup_count, encoding="utf-8"
+            )
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+            )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,5 +1,6 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QMessageBox
 from auth import register_user, verify_user
+from workers import default_runner
 
 class LoginPage(QWidget):
     def __init__(self, main_window):
@@ -36,13 +37,34 @@ class LoginPage(QWidget):
         username = self.username_input.text()
         password = self.password_input.text()
 
-        if verify_user(username, password):
+        # The database lookup runs on a worker thread; the result comes back
+        # to on_login_result on the GUI thread
+        self.set_busy(True)
+        default_runner().submit(
+            verify_user, username, password,
+            name="verify_user", group="auth",
+            on_result=self.on_login_result, on_error=self.on_auth_error,
+        )
+
+    def on_login_result(self, verified):
+        self.set_busy(False)
+        if verified:
             QMessageBox.information(self, "Login Successful", "Welcome!")
             self.main_window.show_main_gui()
         else:
             QMessageBox.warning(self, "Login Failed", "Invalid username or password!")
 
+    def on_auth_error(self, error):
+        self.set_busy(False)
+        QMessageBox.critical(self, "Login Failed", f"Could not reach the user database: {error}")
+
+    def set_busy(self, busy):
+        self.login_button.setEnabled(not busy)
+        self.signup_button.setEnabled(not busy)
+
     def open_signup_page(self):
+        default_runner().cancel(group="auth")
+        self.set_busy(False)
         self.main_window.show_signup_page()
 
 
@@ -81,11 +103,30 @@ class SignupPage(QWidget):
         username = self.username_input.text()
         password = self.password_input.text()
 
-        if register_user(username, password):
+        self.set_busy(True)
+        default_runner().submit(
+            register_user, username, password,
+            name="register_user", group="auth",
+            on_result=self.on_signup_result, on_error=self.on_auth_error,
+        )
+
+    def on_signup_result(self, registered):
+        self.set_busy(False)
+        if registered:
             QMessageBox.information(self, "Signup Successful", "You can now log in!")
             self.main_window.show_login_page()
         else:
             QMessageBox.warning(self, "Signup Failed", "Username already taken!")
 
+    def on_auth_error(self, error):
+        self.set_busy(False)
+        QMessageBox.critical(self, "Signup Failed", f"Could not reach the user database: {error}")
+
+    def set_busy(self, busy):
+        self.signup_button.setEnabled(not busy)
+        self.back_button.setEnabled(not busy)
+
     def back_to_login(self):
+        default_runner().cancel(group="auth")
+        self.set_busy(False)
         self.main_window.show_login_page()
@@ -1,4 +1,6 @@
+import os
 import sys
+import time
 import cv2 as cv
 import numpy as np
 from face_verification import *
@@ -13,6 +15,11 @@ from liveness_detection.face_orientation import FaceOrientationDetector
 from PyQt5.QtWidgets import QApplication, QMainWindow, QStackedWidget
 from utils.functions import *
 from verification_models import VGGFace2
+from workers import default_runner
+from camera_service import CameraService
+from profiling import profiler, span
+from evidence_archive import EvidenceArchiver
+import enrollment
 
 
 class MainWindow(QMainWindow):
@@ -31,21 +38,41 @@ class MainWindow(QMainWindow):
         self.mtcnn = MTCNN(device=self.device)
 
         self.verification_model = VGGFace2.load_model(device=self.device)
+        # fast / accurate / cascade picks a backend by calibrated profile;
+        # unset keeps the single VGG-Face2 model
+        self.verification_mode = os.getenv("VERIFICATION_MODE") or None
 
         self.blink_detector = BlinkDetector()
         self.face_orientation_detector = FaceOrientationDetector()
         self.emotion_preidictor = EmotionPredictor(device=self.device)
 
-        # camera
-        self.camera = cv.VideoCapture(0)
+        # Background tasks (database, inference) run off the GUI thread
+        self.tasks = default_runner()
+
+        # Evidence (frames, verdicts) per KYC session, encoded and written
+        # in the background
+        retention = os.getenv("EVIDENCE_RETENTION_DAYS", "90")
+        self.evidence = EvidenceArchiver(
+            os.getenv("EVIDENCE_DIR", "evidence"),
+            retention_days=float(retention) if retention else None,
+        )
+        self.evidence_session = None
+        # Passed liveness challenges that complete a KYC run
+        self.liveness_challenges = int(os.getenv("LIVENESS_CHALLENGES", 3))
+        self.liveness_passed = 0
+
+        # camera: opened once and shared; each page gets its own handle
+        self.camera = CameraService(0, idle_timeout=10.0)
+        self.verification_camera = self.camera.client()
+        self.challenge_camera = self.camera.client()
 
         # stack widget
         self.stacked_widget = QStackedWidget()
         self.setCentralWidget(self.stacked_widget)
         self.first_page = IDCardPhoto(main_window=self)
-        self.second_page = VerificationWindow(camera=self.camera, main_window=self)
+        self.second_page = VerificationWindow(camera=self.verification_camera, main_window=self)
         self.third_page = ChallengeWindow(
-            camera=self.camera,
+            camera=self.challenge_camera,
             main_window=self,
             mtcnn=self.mtcnn,
             list_models=[
@@ -60,37 +87,186 @@ class MainWindow(QMainWindow):
         self.stacked_widget.addWidget(self.third_page)
 
     def verify(self):
-        id_image = get_image(self.first_page.img_path)
-        verification_image = self.second_page.verification_image
+        """Verifies on the calling thread; from the GUI this freezes the window.
+
+        Pages should call verify_async() instead (see README).
+        """
+        evidence = self.current_evidence()
+        outcome = self._run_verification(
+            self.first_page.img_path,
+            self.second_page.verification_image,
+        )
+        return self._record_verification(evidence, *outcome)
+
+    def verify_async(self, on_result, on_error=None):
+        """Runs verify() on a worker thread and calls on_result(verified) on the GUI thread."""
+        # Read page state here, on the GUI thread; only the heavy work moves
+        evidence = self.current_evidence()
+
+        def done(outcome):
+            verified = self._record_verification(evidence, *outcome)
+            if on_result is not None:
+                on_result(verified)
+
+        return self.tasks.submit(
+            self._run_verification,
+            self.first_page.img_path,
+            self.second_page.verification_image,
+            name="verify",
+            group="verification",
+            on_result=done,
+            on_error=on_error,
+        )
+
+    def _run_verification(self, img_path, verification_image):
+        start = time.perf_counter()
+        with span("MainWindow.verify"):
+            with span("get_image"):
+                id_image = get_image(img_path)
+
+            result = verify_with_mode(
+                id_image,
+                verification_image,
+                self.mtcnn,
+                mode=self.verification_mode,
+                verifier_model=self.verification_model,
+                model_name="VGG-Face2",
+            )
+        result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return id_image, verification_image, result
+
+    def _record_verification(self, evidence, id_image, verification_image, result):
+        """Archives a verification result (GUI thread). Returns whether it passed."""
+        # Leaving the page may have closed the session while the worker ran
+        if evidence is self.evidence_session:
+            evidence.add_frame("id_card", id_image)
+            evidence.add_frame("verification", verification_image)
+            evidence.add_verdict(
+                "face_verification",
+                result["verified"],
+                backend=result["backend"],
+                distance=result["distance"],
+                threshold=result["threshold"],
+                escalated=result["escalated"],
+                duration_ms=result["duration_ms"],
+            )
+            if not result["verified"]:
+                self.finish_evidence("failed")
+        return result["verified"]
 
-        verified = verify(
-            id_image,
-            verification_image,
+    def current_evidence(self):
+        """The evidence session of the KYC run in progress (GUI thread)."""
+        if self.evidence_session is None:
+            self.evidence_session = self.evidence.begin_session(
+                id_image=os.path.basename(self.first_page.img_path or ""),
+                verification_mode=self.verification_mode,
+            )
+            self.liveness_passed = 0
+        return self.evidence_session
+
+    def record_liveness(self, frame, challenge, passed, **details):
+        """Archives a liveness frame and the challenge verdict (GUI thread).
+
+        The challenge page calls this once per challenge: passed=True when it
+        is answered, passed=False when it times out or the user gives up. The
+        frame is copied, since camera buffers are reused.
+
+        Returns:
+            str or None: The run's outcome once it is decided ("passed" after
+            ``liveness_challenges`` passed challenges, "failed" after a failed
+            one; the session is then closed), otherwise None.
+        """
+        evidence = self.current_evidence()
+        evidence.add_frame("liveness", frame, copy=True, challenge=challenge)
+        evidence.add_verdict("liveness", passed, challenge=challenge, **details)
+        if not passed:
+            outcome = "failed"
+        else:
+            self.liveness_passed += 1
+            if self.liveness_passed < self.liveness_challenges:
+                return None
+            outcome = "passed"
+        self.finish_evidence(outcome)
+        return outcome
+
+    def finish_evidence(self, outcome):
+        """Closes the current session; its bundle is written in the background."""
+        if self.evidence_session is not None:
+            self.evidence_session.close(outcome)
+            self.evidence_session = None
+
+    def enroll_async(self, username, on_result=None, on_error=None):
+        """Stores the ID-card embedding so the user can re-verify with a selfie only."""
+        def run(img_path):
+            return enrollment.enroll(
+                username, get_image(img_path), self.mtcnn, self.verification_model
+            )
+
+        return self.tasks.submit(
+            run, self.first_page.img_path,
+            name="enroll", group="verification",
+            on_result=on_result, on_error=on_error,
+        )
+
+    def reverify_async(self, username, on_result, on_error=None):
+        """Re-verifies a returning user against the stored embedding.
+
+        on_result receives None when the user has no current enrollment and
+        must go through the ID-photo flow.
+        """
+        return self.tasks.submit(
+            enrollment.reverify,
+            username,
+            self.second_page.verification_image,
             self.mtcnn,
             self.verification_model,
-            model_name="VGG-Face2",
+            name="reverify",
+            group="verification",
+            on_result=on_result,
+            on_error=on_error,
         )
 
-        return verified
-
     def switch_page(self, index):
+        # Results of work started on the page being left are no longer wanted
+        self.tasks.cancel(group="verification")
+
+        # open_camera/close_camera only (un)subscribe the page from the shared
+        # camera service, so switching pages does not re-initialize the device
         if index == 0:
+            # Back to the start: a run that did not finish is archived as such
+            self.finish_evidence("abandoned")
             self.first_page.clear_window()
             self.second_page.close_camera()
             self.third_page.close_camera()
+            self.verification_camera.release()
+            self.challenge_camera.release()
 
         elif index == 1:
             self.second_page.clear_window()
+            self.verification_camera.open()
             self.second_page.open_camera()
             self.third_page.close_camera()
+            self.challenge_camera.release()
 
         elif index == 2:
             self.third_page.clear_window()
+            self.challenge_camera.open()
             self.third_page.open_camera()
             self.second_page.close_camera()
+            self.verification_camera.release()
 
         self.stacked_widget.setCurrentIndex(index)
 
+    def closeEvent(self, event):
+        self.tasks.cancel()
+        self.finish_evidence("abandoned")
+        self.evidence.close()
+        self.camera.close()
+        if profiler.enabled:
+            print(profiler.format_stats())
+            profiler.export_chrome_trace(os.getenv("KYC_PROFILE_OUTPUT", "kyc_trace.json"))
+        super().closeEvent(event)
+
 
 def launch_pyqt5_app():
     app = QApplication(sys.argv)
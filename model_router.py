@@ -0,0 +1,237 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class ModelUnavailableError(Exception):
+    """Raised when every candidate model has its circuit breaker open."""
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open, calls are refused until ``reset_timeout`` seconds have passed;
+    then a single trial call is let through (half-open). Success closes the
+    breaker, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release(self):
+        """Returns a trial slot whose call never ran."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class ModelStats:
+    """Rolling latency and error window for one model."""
+
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            if ok:
+                self.latencies.append(latency)
+            self.outcomes.append(ok)
+
+    def percentile(self, pct):
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+    def error_rate(self):
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def sample_count(self):
+        with self._lock:
+            return len(self.latencies)
+
+
+class ModelRouter:
+    """Routes a chat turn across models with hedging and circuit breakers.
+
+    The requested model is tried first. If it has not answered by its
+    ``hedge_percentile`` latency (or fails with an error ``is_failure``
+    accepts), the same request is sent to the fastest other healthy model and
+    whichever succeeds first wins; hedges that have not started by then are
+    cancelled. Errors caused by the request itself are raised at once.
+    Models whose breaker is open are skipped.
+    """
+
+    def __init__(self, models, hedge_percentile=95, default_hedge_delay=5.0,
+                 min_hedge_delay=0.5, min_samples=10, window=100,
+                 failure_threshold=5, reset_timeout=30.0, max_workers=64,
+                 is_failure=None):
+        self.models = list(models)
+        # Which exceptions count against a model's breaker; errors caused by
+        # the request itself (e.g. a 400) say nothing about the model's health
+        self.is_failure = is_failure or (lambda exc: True)
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.stats = {model: ModelStats(window) for model in self.models}
+        self.breakers = {
+            model: CircuitBreaker(failure_threshold, reset_timeout) for model in self.models
+        }
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-router")
+
+    def hedge_delay(self, model):
+        stats = self.stats[model]
+        if stats.sample_count() < self.min_samples:
+            return self.default_hedge_delay
+        return max(stats.percentile(self.hedge_percentile), self.min_hedge_delay)
+
+    def _by_speed(self, models):
+        def median(model):
+            p50 = self.stats[model].percentile(50)
+            return p50 if p50 is not None else float("inf")
+        return sorted(models, key=median)
+
+    def _submit(self, model, fn):
+        # Run in a copy of the caller's context so request_id_var and other
+        # context variables reach log records written from the pool
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._timed, model, fn)
+
+    def _timed(self, model, fn):
+        start = time.perf_counter()
+        try:
+            result = fn(model)
+        except Exception as e:
+            if self.is_failure(e):
+                self.stats[model].record(time.perf_counter() - start, False)
+                self.breakers[model].record_failure()
+            else:
+                # The model answered; release a half-open trial slot too
+                self.stats[model].record(time.perf_counter() - start, True)
+                self.breakers[model].record_success()
+            raise
+        self.stats[model].record(time.perf_counter() - start, True)
+        self.breakers[model].record_success()
+        return result
+
+    def _next_allowed(self, candidates):
+        # Breakers are consulted only when a model is about to be used, so a
+        # half-open trial slot is never claimed by a model that is not called
+        while candidates:
+            model = candidates.pop(0)
+            if self.breakers[model].allow():
+                return model
+        return None
+
+    def call(self, primary, fn):
+        """Runs ``fn(model)`` and returns ``(result, model_that_answered)``."""
+        if primary not in self.stats:
+            return fn(primary), primary
+
+        candidates = [primary] + self._by_speed(m for m in self.models if m != primary)
+        first = self._next_allowed(candidates)
+        if first is None:
+            raise ModelUnavailableError("All models are unavailable (circuit breakers open)")
+        if first != primary:
+            logger.warning(f"Circuit open for {primary}, routing to {first}")
+
+        pending = {}
+        pending[self._submit(first, fn)] = first
+        deadline = self.hedge_delay(first)
+
+        last_error = None
+        while pending:
+            done, _ = wait(list(pending), timeout=deadline, return_when=FIRST_COMPLETED)
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"Model {model} failed: {e}")
+                    if not self.is_failure(e):
+                        # The request itself is bad; another model would
+                        # reject it too
+                        self._cancel(pending)
+                        raise
+                    last_error = e
+                else:
+                    self._cancel(pending)
+                    return result, model
+
+            # Hedge when the request is slow or failed; only one hedge per
+            # missed deadline so a slowdown does not multiply upstream load
+            hedge = self._next_allowed(candidates)
+            if hedge is not None:
+                logger.info(f"Hedging request to {hedge} after {deadline:.2f}s")
+                pending[self._submit(hedge, fn)] = hedge
+                deadline = self.hedge_delay(hedge)
+            else:
+                deadline = None
+
+        raise last_error
+
+    def _cancel(self, pending):
+        """Cancels losing requests that have not started yet."""
+        for future, model in pending.items():
+            if future.cancel():
+                self.breakers[model].release()
+
+    def snapshot(self):
+        """Current per-model latency, error rate and breaker state."""
+        return {
+            model: {
+                "p50": self.stats[model].percentile(50),
+                "p95": self.stats[model].percentile(95),
+                "error_rate": self.stats[model].error_rate(),
+                "circuit": self.breakers[model].state,
+            }
+            for model in self.models
+        }
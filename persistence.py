@@ -0,0 +1,335 @@
+import atexit
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from bson import json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev server only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def init_schema(db):
+    """Creates collections and indexes once at startup.
+
+    create_index creates a missing collection and is idempotent, so gunicorn
+    workers booting together on a fresh database do not race each other.
+    """
+    # Compound index serves the /history filter, sort and keyset cursor
+    # from a single index scan
+    db["chats"].create_index([("user_id", 1), ("timestamp", -1), ("_id", -1)])
+    db["conversations"].create_index([("user_id", 1)], unique=True)
+    db["feedback"].create_index([("user_id", 1)])
+    db["feedback"].create_index([("chat_id", 1)])
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class WriteBehindWriter:
+    """Buffers inserts in a bounded queue and writes them with ``insert_many``.
+
+    Documents are flushed when ``batch_size`` documents are pending or
+    ``flush_interval`` seconds have passed since the first pending one.
+    Documents that cannot be written (Mongo unavailable, queue full) are
+    appended to ``spill_path`` as extended JSON and replayed on the next start.
+    Documents should carry their own ``_id`` so replays stay idempotent.
+
+    Several gunicorn workers share ``spill_path``; appends and replay claims
+    are serialized across processes with an flock on ``<spill_path>.lock``.
+    Lines that cannot be parsed (e.g. torn by a crash mid-spill) are moved to
+    ``<spill_path>.corrupt`` instead of stopping the replay.
+
+    Pending documents are counted per collection and per ``user_id`` field, so
+    a read-your-writes check only flushes when that user has writes queued.
+
+    ``on_write``, if given, is called as ``on_write(collection_name, count,
+    seconds, ok)`` after every ``insert_many``.
+    """
+
+    def __init__(self, db, batch_size=100, flush_interval=0.5, max_queue=10000,
+                 spill_path="mongo_spill.jsonl", put_timeout=0.05, on_write=None):
+        self.db = db
+        self.on_write = on_write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, collection_name, document):
+        """Queues a document for insertion without blocking the request."""
+        if self._closed:
+            self._spill([(collection_name, document)])
+            return
+        self._add_pending([(collection_name, document)])
+        try:
+            self._queue.put((collection_name, document), timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning(f"Write-behind queue full, spilling {collection_name} document to disk")
+            self._mark_written([(collection_name, document)])
+            self._spill([(collection_name, document)])
+
+    def has_pending(self, collection_name, user_id=None):
+        """True while documents for ``collection_name`` (of ``user_id``, if given) are unwritten."""
+        with self._pending_lock:
+            return self._pending.get((collection_name, user_id), 0) > 0
+
+    def flush(self, timeout=5.0):
+        """Blocks until everything queued before this call has been written."""
+        if self._thread is None or not self._thread.is_alive():
+            return False
+        request = _FlushRequest()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return request.done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Drains the queue on shutdown; whatever is left is spilled to disk."""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                leftovers.append(item)
+        if leftovers:
+            self._spill(leftovers)
+
+    def _run(self):
+        try:
+            self.replay_spill()
+        except Exception:
+            # The claimed file is kept and retried on the next start
+            logger.exception("Replaying spilled documents failed")
+
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+
+            if isinstance(item, tuple):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            flush_now = (
+                item is None
+                or item is False
+                or isinstance(item, _FlushRequest)
+                or len(batch) >= self.batch_size
+            )
+            if flush_now and batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    logger.exception(f"Unexpected error writing {len(batch)} documents")
+                batch = []
+            if flush_now:
+                deadline = None
+
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            elif item is None:
+                return
+
+    def _write(self, batch):
+        by_collection = {}
+        for collection_name, document in batch:
+            by_collection.setdefault(collection_name, []).append(document)
+
+        try:
+            for collection_name, documents in by_collection.items():
+                start = time.perf_counter()
+                ok = False
+                try:
+                    self.db[collection_name].insert_many(documents, ordered=False)
+                    ok = True
+                    logger.info(f"Flushed {len(documents)} documents to {collection_name}")
+                except BulkWriteError as e:
+                    # Duplicates come from replayed spills that already landed
+                    failed = [
+                        err for err in e.details.get("writeErrors", [])
+                        if err.get("code") != DUPLICATE_KEY_ERROR
+                    ]
+                    if failed:
+                        logger.error(f"Failed to write {len(failed)} documents to {collection_name}")
+                        self._spill([(collection_name, documents[err["index"]]) for err in failed])
+                except PyMongoError as e:
+                    logger.error(f"Mongo unavailable, spilling {len(documents)} {collection_name} documents: {e}")
+                    self._spill([(collection_name, doc) for doc in documents])
+                if self.on_write:
+                    self.on_write(collection_name, len(documents), time.perf_counter() - start, ok)
+        finally:
+            # Never leave has_pending() stuck, even if a write blew up
+            self._mark_written(batch)
+
+    @staticmethod
+    def _pending_keys(collection_name, document):
+        keys = [(collection_name, None)]
+        user_id = document.get("user_id") if isinstance(document, dict) else None
+        if user_id is not None:
+            keys.append((collection_name, user_id))
+        return keys
+
+    def _add_pending(self, batch):
+        with self._pending_lock:
+            for collection_name, document in batch:
+                for key in self._pending_keys(collection_name, document):
+                    self._pending[key] = self._pending.get(key, 0) + 1
+
+    def _mark_written(self, batch):
+        with self._pending_lock:
+            for collection_name, document in batch:
+                for key in self._pending_keys(collection_name, document):
+                    count = self._pending.get(key, 0) - 1
+                    # Drop settled keys so per-user entries do not pile up
+                    if count > 0:
+                        self._pending[key] = count
+                    else:
+                        self._pending.pop(key, None)
+
+    @contextmanager
+    def _spill_file_lock(self):
+        """Serializes spill-file access across threads and worker processes."""
+        with self._spill_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.spill_path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _spill(self, items):
+        with self._spill_file_lock():
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for collection_name, document in items:
+                    f.write(json_util.dumps({"collection": collection_name, "document": document}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _claim_spill(self):
+        """Moves every pending spill into this process's replay file.
+
+        Sources are the live spill file, a ``.replay`` left by older
+        versions and the replay files of workers that died mid-replay. They
+        are appended, never replaced, so nothing claimed earlier is lost.
+
+        Returns:
+            str or None: the claimed file, or None if there was nothing to replay.
+        """
+        claim_path = f"{self.spill_path}.replay.{os.getpid()}"
+        with self._spill_file_lock():
+            sources = [self.spill_path, f"{self.spill_path}.replay"]
+            for path in glob.glob(f"{glob.escape(self.spill_path)}.replay.*"):
+                pid = path.rsplit(".", 1)[-1]
+                if not pid.isdigit() or int(pid) == os.getpid():
+                    continue
+                # Without fcntl there is a single process, so any other
+                # pid's file is an orphan (and os.kill would terminate it)
+                if fcntl is None or not _pid_alive(int(pid)):
+                    sources.append(path)
+
+            sources = [path for path in sources if os.path.exists(path)]
+            if not sources:
+                return claim_path if os.path.exists(claim_path) else None
+            with open(claim_path, "ab") as claim:
+                for path in sources:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    if data and not data.endswith(b"\n"):
+                        data += b"\n"
+                    claim.write(data)
+                claim.flush()
+                os.fsync(claim.fileno())
+            for path in sources:
+                os.remove(path)
+        return claim_path
+
+    def replay_spill(self):
+        """Re-inserts spilled documents; the claimed file is removed once all land."""
+        replay_path = self._claim_spill()
+        if replay_path is None:
+            return
+
+        batch = []
+        corrupt = []
+        with open(replay_path, encoding="utf-8", errors="replace") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json_util.loads(line)
+                    batch.append((record["collection"], record["document"]))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.error(f"Skipping unreadable spill line {number}: {e}")
+                    corrupt.append(line if line.endswith("\n") else line + "\n")
+        if corrupt:
+            with self._spill_file_lock():
+                with open(f"{self.spill_path}.corrupt", "a", encoding="utf-8") as f:
+                    f.writelines(corrupt)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        logger.info(f"Replaying {len(batch)} spilled documents")
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            self._add_pending(chunk)
+            # Documents that still fail are spilled again by _write
+            self._write(chunk)
+        os.remove(replay_path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
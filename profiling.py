@@ -0,0 +1,151 @@
+"""Opt-in stage profiling for the KYC pipeline.
+
+Wrap a stage in ``with span("name"):``. When profiling is off (the default)
+``span`` returns a shared no-op context manager, so the cost is one
+attribute check per stage. Enable with KYC_PROFILE=1 or
+``profiler.enable()``; collected spans export as Chrome trace-event JSON
+(open in chrome://tracing or Perfetto) or as per-stage statistics.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled=False, max_events=100000):
+        self.enabled = enabled
+        self._events = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start_ns, end_ns, args=None):
+        event = (name, start_ns, end_ns, threading.get_ident(), args or None)
+        with self._lock:
+            self._events.append(event)
+
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    def chrome_trace(self):
+        """Returns the spans as a Chrome trace-event document."""
+        pid = os.getpid()
+        trace_events = []
+        for name, start, end, tid, args in self.events():
+            event = {
+                "name": name,
+                "cat": name.split(".", 1)[0],
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pid,
+                "tid": tid,
+            }
+            if args:
+                event["args"] = {key: str(value) for key, value in args.items()}
+            trace_events.append(event)
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def stage_stats(self):
+        """Returns {stage: {count, total_ms, mean_ms, p50_ms, p95_ms, max_ms}}."""
+        durations = {}
+        for name, start, end, _, _ in self.events():
+            durations.setdefault(name, []).append((end - start) / 1e6)
+
+        stats = {}
+        for name, values in durations.items():
+            values.sort()
+            count = len(values)
+            stats[name] = {
+                "count": count,
+                "total_ms": sum(values),
+                "mean_ms": sum(values) / count,
+                "p50_ms": values[int(0.5 * (count - 1))],
+                "p95_ms": values[int(round(0.95 * (count - 1)))],
+                "max_ms": values[-1],
+            }
+        return stats
+
+    def format_stats(self):
+        lines = [f"{'stage':<28} {'count':>6} {'mean ms':>9} {'p95 ms':>9} {'total ms':>10}"]
+        ordered = sorted(self.stage_stats().items(), key=lambda item: -item[1]["total_ms"])
+        for name, s in ordered:
+            lines.append(
+                f"{name:<28} {s['count']:>6} {s['mean_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['total_ms']:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+profiler = Profiler(enabled=os.getenv("KYC_PROFILE", "0") == "1")
+
+
+def span(name, **args):
+    """Times a pipeline stage on the global profiler."""
+    return profiler.span(name, **args)
+
+
+def profiled(name=None):
+    """Decorator form of ``span``."""
+    def decorator(fn):
+        stage = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+            with profiler.span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
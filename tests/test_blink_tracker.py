@@ -0,0 +1,81 @@
+"""Replays EAR sequences through every blink counting path.
+
+Per-frame ``BlinkTracker.update`` is the reference; ``update_many`` (which
+runs the vectorized ``_hysteresis``) and ``BlinkTrackerBank`` must agree with
+it frame for frame.
+"""
+import numpy as np
+import pytest
+
+from blink_tracker import BlinkTracker, BlinkTrackerBank
+
+
+def synthetic_ears(rng, frames, open_ear=0.30, closed_ear=0.12, noise=0.02, blink_rate=0.08):
+    """Random EAR sequence with blinks of 1-6 frames and values near the thresholds."""
+    ears = rng.normal(open_ear, noise, frames)
+    start = 0
+    while True:
+        start += int(rng.geometric(blink_rate))
+        if start >= frames:
+            break
+        length = int(rng.integers(1, 7))
+        ears[start:start + length] = rng.normal(closed_ear, noise, min(length, frames - start))
+        start += length
+    # Values between the thresholds exercise the hysteresis band
+    band = rng.random(frames) < 0.1
+    ears[band] = rng.uniform(0.18, 0.26, int(band.sum()))
+    return np.clip(ears, 0.0, None).astype(np.float32)
+
+
+def replay(ears, rng, capacity, smoothing, min_closed_frames, max_batch=80):
+    """Feeds ``ears`` to all three paths, asserting they agree after every batch.
+
+    ``update_many`` gets random batches, including empty ones and batches
+    longer than ``capacity``; the bank gets one frame at a time next to a
+    second, unrelated session.
+    """
+    reference = BlinkTracker(capacity, smoothing, min_closed_frames=min_closed_frames)
+    batched = BlinkTracker(capacity, smoothing, min_closed_frames=min_closed_frames)
+    bank = BlinkTrackerBank(capacity, smoothing, min_closed_frames=min_closed_frames, initial_sessions=1)
+    bank.reset("replay")
+    bank.reset("other")
+    other = rng.permutation(ears)
+    row = bank._rows["replay"]
+
+    position = 0
+    while position < ears.size:
+        size = int(rng.integers(0, max_batch + 1))
+        batch = ears[position:position + size]
+        expected = sum(reference.update(ear) for ear in batch)
+        assert batched.update_many(batch) == expected, f"frames {position}-{position + size}"
+        for i, ear in enumerate(batch):
+            bank.update(["replay", "other"], [ear, other[position + i]])
+        position += size
+
+        where = f"after frame {position}"
+        assert reference.blinks == batched.blinks == bank.blinks("replay"), where
+        assert reference._state == batched._state == bank._state[row], where
+        assert reference._closed_run == batched._closed_run == bank._closed_run[row], where
+        np.testing.assert_array_equal(reference.recent(), batched.recent(), err_msg=where)
+        assert batched._window_sum == pytest.approx(reference._window_sum, abs=1e-5), where
+    return reference.blinks
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_update_many_and_bank_match_per_frame_updates(seed):
+    rng = np.random.default_rng(seed)
+    # Small capacities wrap the ring buffer often
+    smoothing = int(rng.integers(1, 6))
+    capacity = int(rng.integers(smoothing, 96))
+    min_closed_frames = int(rng.integers(1, 4))
+    replay(synthetic_ears(rng, 600), rng, capacity, smoothing, min_closed_frames)
+
+
+def test_counts_a_clean_blink():
+    ears = np.array([0.3] * 5 + [0.1] * 4 + [0.3] * 5, dtype=np.float32)
+    assert replay(ears, np.random.default_rng(0), capacity=8, smoothing=1, min_closed_frames=2) == 1
+
+
+def test_short_closure_is_noise():
+    ears = np.array([0.3] * 5 + [0.1] + [0.3] * 5, dtype=np.float32)
+    assert replay(ears, np.random.default_rng(0), capacity=8, smoothing=1, min_closed_frames=2) == 0
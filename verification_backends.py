@@ -0,0 +1,367 @@
+"""Registry of face verification backends.
+
+A backend wraps one embedding model behind a common interface: how to load
+it, how faces are preprocessed for it (``face_transform`` with the backend's
+``model_name``), its embedding size and its decision thresholds. Each backend
+carries a ``BackendProfile`` (CPU latency per face, memory, and the EER and
+threshold measured on a labelled pair set) so callers can pick by mode:
+
+- ``"fast"``: the backend with the lowest measured latency
+- ``"accurate"``: the backend with the lowest measured EER
+- ``"cascade"``: screen with the fast backend and re-check with the accurate
+  one only when the fast distance lands near its threshold
+
+Profiles are measured with
+
+    python verification_backends.py calibrate --pairs pairs.csv
+
+and saved to VERIFICATION_PROFILES (verification_profiles.json), which is
+read on first lookup of a backend. Until a backend is calibrated it ranks by
+model size and uses the library thresholds.
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import torch
+
+from utils.distance import *
+from utils.functions import face_transform, findThreshold
+
+PROFILES_PATH = os.getenv("VERIFICATION_PROFILES", "verification_profiles.json")
+DEFAULT_BACKEND = os.getenv("VERIFICATION_BACKEND", "vggface2")
+MODES = ("fast", "accurate", "cascade")
+
+distance_metric = {
+    "cosine": Cosine_Distance,
+    "L1": L1_Distance,
+    "euclidean": Euclidean_Distance,
+}
+
+
+class BackendProfile:
+    """Measured cost and accuracy of a backend.
+
+    ``eer_threshold`` is the distance threshold at the equal error rate for
+    ``metric``; it replaces the library threshold once calibrated.
+    """
+
+    def __init__(self, latency_ms=None, memory_mb=None, eer=None, eer_threshold=None,
+                 metric="euclidean", pairs=0, source="nominal", measured_at=None):
+        self.latency_ms = latency_ms
+        self.memory_mb = memory_mb
+        self.eer = eer
+        self.eer_threshold = eer_threshold
+        self.metric = metric
+        self.pairs = pairs
+        self.source = source
+        self.measured_at = measured_at
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data[key] for key in vars(cls()) if key in data})
+
+
+class VerificationBackend:
+    """One embedding model and everything needed to compare its embeddings.
+
+    Parameters:
+        name (str): Registry key, e.g. "vggface2".
+        model_name (str): Name understood by ``face_transform``/``findThreshold``.
+        loader (callable): ``loader(device) -> torch.nn.Module``.
+        input_size (int): Side of the square face crop the model expects.
+        embedding_dim (int, optional): Filled in on first load when unknown.
+    """
+
+    def __init__(self, name, model_name, loader, input_size, embedding_dim=None, profile=None):
+        self.name = name
+        self.model_name = model_name
+        self.loader = loader
+        self.input_size = input_size
+        self.embedding_dim = embedding_dim
+        self.profile = profile or BackendProfile()
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def load(self, device="cpu"):
+        """Returns the model for ``device``, loading it once."""
+        key = str(device)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = self.loader(device)
+                    model.eval()
+                    if self.embedding_dim is None:
+                        with torch.no_grad():
+                            probe = torch.zeros(1, 3, self.input_size, self.input_size, device=device)
+                            self.embedding_dim = int(model(probe).reshape(1, -1).shape[1])
+                    self._models[key] = model
+        return model
+
+    def adopt(self, model):
+        """Registers an already-loaded model (e.g. the GUI's) for its device."""
+        device = next(model.parameters()).device
+        with self._lock:
+            self._models.setdefault(str(device), model)
+        return self._models[str(device)]
+
+    def preprocess(self, face, device="cpu"):
+        return face_transform(face, model_name=self.model_name, device=device)
+
+    @torch.no_grad()
+    def embed(self, face, model=None, device="cpu"):
+        """Embeds a cropped face (as returned by ``extract_face``)."""
+        if model is None:
+            model = self.load(device)
+        device = next(model.parameters()).device
+        return model(self.preprocess(face, device=device))
+
+    def threshold(self, metric="euclidean"):
+        if self.profile.eer_threshold is not None and self.profile.metric == metric:
+            return self.profile.eer_threshold
+        return findThreshold(model_name=self.model_name, distance_metric=metric)
+
+    def distance(self, embedding1, embedding2, metric="euclidean"):
+        distance_func = distance_metric.get(metric, Euclidean_Distance)
+        return float(distance_func(embedding1, embedding2))
+
+    def compare(self, embedding1, embedding2, metric="euclidean"):
+        """Returns (verified, distance, threshold)."""
+        dis = self.distance(embedding1, embedding2, metric)
+        threshold = self.threshold(metric)
+        return dis < threshold, dis, threshold
+
+    def cost(self):
+        """Sort key for "fast": measured latency first, else model size."""
+        if self.profile.latency_ms is not None:
+            return (0, self.profile.latency_ms)
+        if self.profile.memory_mb is not None:
+            return (1, self.profile.memory_mb)
+        return (2, 0)
+
+
+_backends = {}
+_profiles_loaded = False
+_profiles_lock = threading.Lock()
+
+
+def _ensure_profiles():
+    global _profiles_loaded
+    if not _profiles_loaded:
+        with _profiles_lock:
+            if not _profiles_loaded:
+                load_profiles()
+
+
+def register_backend(backend):
+    _backends[backend.name] = backend
+    return backend
+
+
+def get_backend(name=None):
+    _ensure_profiles()
+    name = name or DEFAULT_BACKEND
+    try:
+        return _backends[name]
+    except KeyError:
+        raise ValueError(f"Unknown verification backend: {name}") from None
+
+
+def backend_for_model_name(model_name):
+    """Finds the backend registered for a ``face_transform`` model name."""
+    _ensure_profiles()
+    for backend in _backends.values():
+        if backend.model_name == model_name:
+            return backend
+    raise ValueError(f"{model_name} is not supported")
+
+
+def available_backends():
+    _ensure_profiles()
+    return list(_backends.values())
+
+
+def select_backend(mode="accurate"):
+    """Picks a backend for ``mode`` from the registered profiles."""
+    _ensure_profiles()
+    if mode == "fast":
+        return min(_backends.values(), key=lambda b: b.cost())
+    if mode == "accurate":
+        calibrated = [b for b in _backends.values() if b.profile.eer is not None]
+        if calibrated:
+            return min(calibrated, key=lambda b: b.profile.eer)
+        return get_backend()
+    raise ValueError(f"Unknown verification mode: {mode}")
+
+
+def _load_vggface2(device):
+    from verification_models import VGGFace2
+    return VGGFace2.load_model(device=device)
+
+
+def _load_vggface(device):
+    from verification_models import VGGFace
+    return VGGFace.load_model(device=device)
+
+
+# Nominal memory is the fp32 parameter size; latency and EER stay unknown
+# until calibrate() has run on this machine
+register_backend(VerificationBackend(
+    "vggface2", "VGG-Face2", _load_vggface2, input_size=160, embedding_dim=512,
+    profile=BackendProfile(memory_mb=90),
+))
+register_backend(VerificationBackend(
+    "vggface", "VGG-Face1", _load_vggface, input_size=224,
+    profile=BackendProfile(memory_mb=550),
+))
+
+
+def load_profiles(path=PROFILES_PATH):
+    """Applies saved calibration results to the registered backends."""
+    global _profiles_loaded
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+        for name, data in saved.items():
+            if name in _backends:
+                _backends[name].profile = BackendProfile.from_dict(data)
+    _profiles_loaded = True
+
+
+def save_profiles(path=PROFILES_PATH):
+    data = {b.name: b.profile.to_dict() for b in _backends.values()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def equal_error_rate(distances, same):
+    """EER of a distance-threshold classifier.
+
+    Parameters:
+        distances (array): Distance per pair.
+        same (array): True where the pair is the same person.
+
+    Returns:
+        tuple: (eer, threshold)
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    same = np.asarray(same, dtype=bool)
+    genuine = np.sort(distances[same])
+    impostor = np.sort(distances[~same])
+    if genuine.size == 0 or impostor.size == 0:
+        raise ValueError("calibration needs both genuine and impostor pairs")
+
+    # Accept when distance < t: FRR(t) = share of genuine >= t,
+    # FAR(t) = share of impostors < t
+    thresholds = np.unique(distances)
+    frr = 1 - np.searchsorted(genuine, thresholds, side="left") / genuine.size
+    far = np.searchsorted(impostor, thresholds, side="left") / impostor.size
+    best = int(np.argmin(np.abs(far - frr)))
+    return float((far[best] + frr[best]) / 2), float(thresholds[best])
+
+
+def measure_latency(backend, device="cpu", repeats=20, warmup=3):
+    """Median milliseconds per face for one forward pass on ``device``."""
+    model = backend.load(device)
+    face = torch.rand(1, 3, backend.input_size, backend.input_size, device=device)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + repeats):
+            start = time.perf_counter()
+            model(face)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def model_memory_mb(model):
+    size = sum(p.numel() * p.element_size() for p in model.parameters())
+    size += sum(b.numel() * b.element_size() for b in model.buffers())
+    return size / (1024 * 1024)
+
+
+def calibrate(backend, pairs, detector_model, metric="euclidean", device="cpu"):
+    """Measures a backend's profile on CPU and on labelled image pairs.
+
+    Parameters:
+        pairs (list): (rgb_image1, rgb_image2, same_person) tuples.
+
+    Returns:
+        BackendProfile
+    """
+    from utils.functions import extract_face
+
+    model = backend.load(device)
+    distances, labels = [], []
+    for img1, img2, same in pairs:
+        face1, box1, _ = extract_face(img1, detector_model, padding=1)
+        face2, box2, _ = extract_face(img2, detector_model, padding=1)
+        if box1 is None or box2 is None:
+            continue
+        distances.append(backend.distance(backend.embed(face1, model), backend.embed(face2, model), metric))
+        labels.append(bool(same))
+
+    eer, threshold = equal_error_rate(distances, labels)
+    return BackendProfile(
+        latency_ms=measure_latency(backend, device),
+        memory_mb=model_memory_mb(model),
+        eer=eer,
+        eer_threshold=threshold,
+        metric=metric,
+        pairs=len(distances),
+        source="calibrated",
+        measured_at=datetime.now().isoformat(timespec="seconds"),
+    )
+
+
+def _read_pairs(path):
+    from utils.functions import get_image
+
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield (
+                get_image(os.path.join(base, row["image1"])),
+                get_image(os.path.join(base, row["image2"])),
+                row["same"].strip().lower() in ("1", "true", "yes"),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    cal = subparsers.add_parser("calibrate", help="measure latency, memory and EER per backend")
+    cal.add_argument("--pairs", required=True, help="CSV with image1,image2,same columns")
+    cal.add_argument("--backends", default=",".join(_backends), help="comma-separated backend names")
+    cal.add_argument("--metric", choices=sorted(distance_metric), default="euclidean")
+    cal.add_argument("--output", default=PROFILES_PATH)
+    subparsers.add_parser("list", help="show registered backends and their profiles")
+    args = parser.parse_args()
+
+    if args.command == "calibrate":
+        from facenet.models.mtcnn import MTCNN
+
+        pairs = list(_read_pairs(args.pairs))
+        detector_model = MTCNN(device="cpu")
+        for name in args.backends.split(","):
+            backend = get_backend(name)
+            backend.profile = calibrate(backend, pairs, detector_model, metric=args.metric)
+            print(f"{name}: {backend.profile.to_dict()}")
+        save_profiles(args.output)
+    else:
+        for backend in available_backends():
+            print(f"{backend.name:<10} {backend.model_name:<10} {backend.profile.to_dict()}")
+
+
+if __name__ == "__main__":
+    main()
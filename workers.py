@@ -0,0 +1,135 @@
+import logging
+import time
+from collections import defaultdict, deque
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerSignals(QObject):
+    """Signals emitted by a Worker; delivered on the GUI thread."""
+
+    result = pyqtSignal(object, object)  # worker, return value
+    error = pyqtSignal(object, object)  # worker, exception
+    finished = pyqtSignal(object, float)  # worker, seconds spent in the task
+
+
+class Worker(QRunnable):
+    """Runs ``fn(*args, **kwargs)`` on a QThreadPool thread.
+
+    Cancellation is cooperative: a worker cancelled before it starts never
+    runs, and one cancelled while running has its result dropped.
+    """
+
+    def __init__(self, fn, *args, name=None, group=None, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.name = name or getattr(fn, "__name__", "task")
+        self.group = group
+        self.signals = WorkerSignals()
+        self.cancelled = False
+        self.on_result = None
+        self.on_error = None
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        if self.cancelled:
+            self.signals.finished.emit(self, 0.0)
+            return
+
+        start = time.perf_counter()
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            if not self.cancelled:
+                self.signals.error.emit(self, e)
+        else:
+            if not self.cancelled:
+                self.signals.result.emit(self, result)
+        finally:
+            self.signals.finished.emit(self, time.perf_counter() - start)
+
+
+class TaskRunner(QObject):
+    """Submits blocking calls (database, model inference) off the GUI thread.
+
+    Callbacks run on the GUI thread. Tasks can be tagged with a ``group`` and
+    cancelled together, e.g. when the user leaves the page that started them.
+    Per-task durations are kept for ``timing_summary`` and emitted through
+    ``task_timed``.
+    """
+
+    task_timed = pyqtSignal(str, float)
+
+    def __init__(self, pool=None, timing_window=100, parent=None):
+        super().__init__(parent)
+        self.pool = pool or QThreadPool.globalInstance()
+        self._active = set()
+        self._timings = defaultdict(lambda: deque(maxlen=timing_window))
+
+    def submit(self, fn, *args, name=None, group=None, on_result=None, on_error=None, **kwargs):
+        worker = Worker(fn, *args, name=name, group=group, **kwargs)
+        worker.on_result = on_result
+        worker.on_error = on_error
+        worker.signals.result.connect(self._handle_result)
+        worker.signals.error.connect(self._handle_error)
+        worker.signals.finished.connect(self._handle_finished)
+        self._active.add(worker)
+        self.pool.start(worker)
+        return worker
+
+    def cancel(self, group=None):
+        """Cancels pending and running tasks, all of them or one group."""
+        for worker in list(self._active):
+            if group is None or worker.group == group:
+                worker.cancel()
+                if self.pool.tryTake(worker):
+                    # Never started; it will not emit finished on its own
+                    self._active.discard(worker)
+
+    def timing_summary(self):
+        """Returns {task name: (count, mean seconds, max seconds)}."""
+        return {
+            name: (len(samples), sum(samples) / len(samples), max(samples))
+            for name, samples in self._timings.items()
+            if samples
+        }
+
+    @pyqtSlot(object, object)
+    def _handle_result(self, worker, result):
+        if not worker.cancelled and worker.on_result is not None:
+            worker.on_result(result)
+
+    @pyqtSlot(object, object)
+    def _handle_error(self, worker, error):
+        if worker.cancelled:
+            return
+        logger.error(f"Task {worker.name} failed: {error}")
+        if worker.on_error is not None:
+            worker.on_error(error)
+
+    @pyqtSlot(object, float)
+    def _handle_finished(self, worker, seconds):
+        self._active.discard(worker)
+        if worker.cancelled and seconds == 0.0:
+            return
+        self._timings[worker.name].append(seconds)
+        self.task_timed.emit(worker.name, seconds)
+        logger.info(f"Task {worker.name} took {seconds * 1000:.1f} ms")
+
+
+_default_runner = None
+
+
+def default_runner():
+    """Shared TaskRunner on the global thread pool. Create after QApplication."""
+    global _default_runner
+    if _default_runner is None:
+        _default_runner = TaskRunner()
+    return _default_runner
@@ -0,0 +1,15 @@
+"""WSGI entry point for serving chat.py in production.
+
+Run with the cooperative (gevent) worker configured in gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The gevent worker monkey-patches sockets, so the Groq call, gTTS and the
+MongoDB driver yield to other requests while they wait on the network instead
+of holding a worker for the whole turn.
+"""
+import os
+
+from chat import app
+
+os.makedirs("static/audio", exist_ok=True)